@@ -39,9 +39,14 @@ Prerequisites
    The XTide forecast requires xtide.  On debian systems, do this:
      sudo apt-get install xtide
 
-   Many of the forecasts require json.  json should be included in python
-   2.6 and 2.7.  For python 2.5 on debian systems, do something like this:
-     sudo apt-get install python-cjson
+   Many of the forecasts require json.  json is included in python 2.6 and
+   later.  If orjson or ujson is installed, it will be used instead since
+   either is much faster at parsing large forecasts:
+     pip install orjson
+
+   If the python requests module is installed, connections to the forecast
+   services are kept alive between downloads.  Otherwise urllib is used.
+     sudo apt-get install python3-requests
 
    Some of the forecasting sites require a subscription.  This extension
    supports only those services with a no-cost level of service.
@@ -73,6 +78,24 @@ Configuration
     # How long to keep old forecasts, in seconds.  use None to keep forever.
     #max_age = 604800
 
+    # How often to remove forecasts older than max_age, in seconds.  If vacuum
+    # is enabled, the database is vacuumed after old forecasts are removed.
+    #prune_interval = 86400
+
+    # How long to reuse a downloaded forecast instead of downloading it again,
+    # in seconds.  Most services update their forecasts only every few hours.
+    # Downloads are cached in memory and on disk in cache_dir, so the cache
+    # survives a restart.  Once a cached copy expires, the next download asks
+    # the server to send the forecast only if it has changed.  Use 0 to
+    # disable caching.
+    #cache_ttl = 0
+    #cache_dir = /var/tmp/weewx-forecast
+
+    # Use write-ahead logging when the forecast database is sqlite.  This
+    # makes saving forecasts cheaper, but should not be used if the database
+    # is on a network file system.
+    #sqlite_wal = False
+
     [[XTide]]
         # Location for which tides are desired
         location = Boston
@@ -513,14 +536,17 @@ $summary.obvis           array
 
 from __future__ import absolute_import
 from __future__ import print_function
+import bisect
 import calendar
+import collections
 import configobj
-import datetime
 import gzip
 import hashlib
 import os, errno
+import random
 import re
 import socket
+import sqlite3
 import subprocess
 import syslog
 import threading
@@ -528,10 +554,28 @@ import time
 
 try:
     # Python 3
-    from io import StringIO
+    from types import MappingProxyType
 except ImportError:
     # Python 2
-    from StringIO import StringIO
+    MappingProxyType = dict
+
+try:
+    # Python 3
+    from functools import lru_cache
+except ImportError:
+    # Python 2 has no lru_cache, so do without the memoization
+    def lru_cache(maxsize=128):
+        def decorator(func):
+            return func
+        return decorator
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport
+    ThreadPoolExecutor = None
+
+from io import BytesIO
 
 try:
     # Python 3
@@ -542,10 +586,10 @@ except ImportError:
 
 try:
     # Python 3
-    from urllib.error import URLError
+    from urllib.error import HTTPError, URLError
 except ImportError:
     # Python 2
-    from urllib2 import URLError
+    from urllib2 import HTTPError, URLError
 
 try:
     # Python 3
@@ -555,14 +599,38 @@ except ImportError:
     from httplib import BadStatusLine, IncompleteRead
 
 try:
-    import cjson as json
-    setattr(json, 'dumps', json.encode)
-    setattr(json, 'loads', json.decode)
-except (ImportError, AttributeError):
+    # requests keeps connections alive between downloads.  fall back to urllib
+    # if it is not installed.
+    import requests
+except ImportError:
+    requests = None
+
+try:
+    # xxhash is a much faster digest for cache keys, if it is installed
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# use the fastest json parser that is available
+try:
+    import orjson
+
+    class json(object):
+        @staticmethod
+        def loads(s):
+            return orjson.loads(s)
+
+        @staticmethod
+        def dumps(obj):
+            return orjson.dumps(obj).decode('utf-8')
+except ImportError:
     try:
-        import simplejson as json
+        import ujson as json
     except ImportError:
-        import json
+        try:
+            import simplejson as json
+        except ImportError:
+            import json
 
 import weewx
 import weedb
@@ -573,18 +641,59 @@ from weewx.cheetahgenerator import SearchList
 
 VERSION = "3.4.0b1"
 
-def logmsg(level, msg):
+# forecast text is plain ascii, so do not bother with unicode character classes
+# when matching regular expressions.  python 2 regexes are ascii by default.
+RE_ASCII = getattr(re, 'ASCII', 0)
+
+def logmsg(level, msg, *args):
+    if args:
+        msg = msg % args
     syslog.syslog(level, 'forecast: %s: %s' %
                   (threading.currentThread().getName(), msg))
 
-def logdbg(msg):
-    logmsg(syslog.LOG_DEBUG, msg)
-
-def loginf(msg):
-    logmsg(syslog.LOG_INFO, msg)
-
-def logerr(msg):
-    logmsg(syslog.LOG_ERR, msg)
+def logdbg(msg, *args):
+    # debug messages are usually masked, so check the mask before doing any
+    # formatting.  setlogmask(0) only reads the mask.  arguments, if any, are
+    # formatted into the message only when it will actually be logged.
+    if syslog.setlogmask(0) & syslog.LOG_MASK(syslog.LOG_DEBUG):
+        logmsg(syslog.LOG_DEBUG, msg, *args)
+
+def loginf(msg, *args):
+    logmsg(syslog.LOG_INFO, msg, *args)
+
+def logerr(msg, *args):
+    logmsg(syslog.LOG_ERR, msg, *args)
+
+@lru_cache(maxsize=4096)
+def _parse_epoch(fmt, s):
+    """convert a UTC time string with the indicated format to epoch seconds.
+    strptime is slow, and forecasts repeat the same strings many times, so
+    remember the results."""
+    return int(calendar.timegm(time.strptime(s, fmt)))
+
+@lru_cache(maxsize=4096)
+def _parse_local_time(fmt, s):
+    """parse a local time string with the indicated format, remembering the
+    results like _parse_epoch"""
+    return time.strptime(s, fmt)
+
+def _parse_local_epoch(fmt, s):
+    """convert a local time string with the indicated format to epoch
+    seconds.  only the parse is remembered, since the conversion depends on
+    the time zone and its daylight saving rules, which can change while
+    weewx is running."""
+    return time.mktime(_parse_local_time(fmt, s))
+
+if xxhash is not None:
+    new_digest = xxhash.xxh64
+elif hasattr(hashlib, 'blake2b'):
+    def new_digest(data=b''):
+        """return a hash object for cache keys.  these digests are never
+        used for security, so use the fastest one."""
+        return hashlib.blake2b(data, digest_size=16)
+else:
+    # blake2b is not available before python 3.6
+    new_digest = hashlib.md5
 
 def mkdir_p(path):
     """equivalent to 'mkdir -p'"""
@@ -597,6 +706,267 @@ def mkdir_p(path):
             raise
 
 
+# identify ourselves to the forecast services, and ask for compressed data.
+# a caller that does not want compression overrides Accept-Encoding.
+HTTP_HEADERS = {
+    'User-Agent': 'weewx-forecast/%s' % VERSION,
+    'Accept-Encoding': 'gzip'}
+
+# how long to wait for a forecast service to respond, in seconds.  downloads
+# run on the forecast pool, so a stalled server must not hold a worker forever.
+DEFAULT_DOWNLOAD_TIMEOUT = 30
+
+# decompress a gzip payload in a single call where the library allows it
+try:
+    gunzip = gzip.decompress
+except AttributeError:
+    # Python 2
+    def gunzip(data):
+        return gzip.GzipFile(fileobj=BytesIO(data)).read()
+
+# how long to wait before the next download attempt, in seconds.  the wait
+# doubles with each failed attempt, and is jittered so that several methods
+# that fail together do not all retry at the same moment.
+DOWNLOAD_RETRY_WAIT = 0.5
+DOWNLOAD_RETRY_WAIT_MAX = 30
+
+def get_retry_wait(count):
+    """return the wait after the indicated (zero-based) failed attempt"""
+    return min(DOWNLOAD_RETRY_WAIT_MAX,
+               DOWNLOAD_RETRY_WAIT * 2 ** count + random.random())
+
+# the exceptions that indicate a failed download attempt
+DOWNLOAD_ERRORS = (socket.error, URLError, BadStatusLine, IncompleteRead)
+if requests is not None:
+    DOWNLOAD_ERRORS += (requests.RequestException,)
+
+# a single session is shared by every forecast method so that connections to
+# each upstream host can be reused from one poll to the next.
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+def _get_session():
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            _SESSION.headers.update(HTTP_HEADERS)
+        return _SESSION
+
+# a server may say how long a response stays fresh (Cache-Control max-age).
+# the download cache reuses the response until then, even past its ttl.
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+def _get_max_age(info):
+    """return how long a response may be reused without asking, in seconds"""
+    cc = info.get('Cache-Control') or ''
+    if 'no-cache' in cc or 'no-store' in cc:
+        return 0
+    m = _MAX_AGE_RE.search(cc)
+    return int(m.group(1)) if m else 0
+
+def _fetch_one(url, headers=None, timeout=None, validators=None):
+    """download a single url, return the body as bytes and the headers of the
+    response.  if the (last_modified, etag) validators of an earlier response
+    are specified, the request is conditional, and the body is None if the
+    server says that the earlier response is still current."""
+    if timeout is None:
+        timeout = DEFAULT_DOWNLOAD_TIMEOUT
+    if validators is not None:
+        headers = dict(headers) if headers else dict()
+        if validators[0]:
+            headers['If-Modified-Since'] = validators[0]
+        if validators[1]:
+            headers['If-None-Match'] = validators[1]
+    if requests is not None and url.startswith('http'):
+        response = _get_session().get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and validators is not None:
+            return None, response.headers
+        response.raise_for_status()
+        return response.content, response.headers
+    request = Request(url)
+    hdrs = dict(HTTP_HEADERS)
+    if headers:
+        hdrs.update(headers)
+    for k in hdrs:
+        request.add_header(k, hdrs[k])
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        if e.code == 304 and validators is not None:
+            return None, e.info()
+        raise
+    data = response.read()
+    if response.info().get('Content-Encoding') == 'gzip':
+        data = gunzip(data)
+    return data, response.info()
+
+def download_url(url, method_id, max_tries=3, headers=None, timeout=None,
+                 cache=None):
+    """download a url, retrying up to max_tries times.  return the body as
+    bytes, or None if every attempt failed.  if a cache is specified, a
+    recent copy of the url is used instead of downloading it again, and
+    once that copy has expired the download is conditional on it."""
+    validators = None
+    if cache is not None:
+        data = cache.get(url)
+        if data is not None:
+            logdbg('%s: using cached copy of forecast' % method_id)
+            return data
+        validators = cache.get_validators(url)
+    for count in range(max_tries):
+        try:
+            data, info = _fetch_one(url, headers, timeout, validators)
+        except DOWNLOAD_ERRORS as e:
+            logerr('%s: failed attempt %d to download forecast: %s' %
+                   (method_id, count + 1, e))
+            if count + 1 < max_tries:
+                time.sleep(get_retry_wait(count))
+            continue
+        if data is None:
+            logdbg('%s: forecast has not changed' % method_id)
+            return cache.refresh(url, info)
+        if cache is not None:
+            cache.put(url, data, info)
+        return data
+    logerr('%s: failed to download forecast' % method_id)
+    return None
+
+
+class ForecastCache(object):
+    """Cache of downloaded forecasts.
+
+    The raw response for each url is saved to disk, compressed, so that the
+    cache survives a restart.  A sidecar file records when the response was
+    fetched, when it expires, and the Last-Modified and ETag validators the
+    server sent with it.  Files are named by a digest of the url so that api
+    keys do not end up in the file names.  The most recent response for each
+    url is also kept in memory, so that a hit does not have to read and
+    decompress the file.
+
+    A response is reused until the ttl or, if it is longer, the Cache-Control
+    max-age of the response has passed.  After that the response is kept, so
+    that the next download can ask the server whether it has changed, and a
+    server whose forecast has not changed can reply 304 Not Modified without
+    sending the body again.
+    """
+
+    def __init__(self, cache_dir, ttl):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.mem = dict() # url -> (expires_at, data, last_modified, etag)
+
+    @staticmethod
+    def get_key(url):
+        if not isinstance(url, bytes):
+            url = url.encode('utf-8')
+        return new_digest(url).hexdigest()
+
+    def _get_paths(self, url):
+        base = os.path.join(self.cache_dir, self.get_key(url))
+        return base + '.gz', base + '.meta'
+
+    def _load(self, url):
+        """return the cached entry for the url, expired or not, or None"""
+        hit = self.mem.get(url)
+        if hit is not None:
+            return hit
+        fn, metafn = self._get_paths(url)
+        try:
+            with open(metafn) as f:
+                meta = json.loads(f.read())
+            with gzip.open(fn, 'rb') as f:
+                data = f.read()
+            hit = (meta.get('expires_at', 0), data,
+                   meta.get('last_modified'), meta.get('etag'))
+            self.mem[url] = hit
+            return hit
+        except (IOError, OSError, ValueError) as e:
+            if getattr(e, 'errno', None) != errno.ENOENT:
+                logdbg('cache read failed for %s: %s' % (fn, e))
+        return None
+
+    def get(self, url, now=None):
+        """return the cached data for the url, or None if there is no data
+        or if the data have expired"""
+        if now is None:
+            now = time.time()
+        hit = self._load(url)
+        if hit is not None and now < hit[0]:
+            return hit[1]
+        return None
+
+    def get_validators(self, url):
+        """return the (last_modified, etag) of the cached data for the url,
+        or None if there is no data or the server sent no validators"""
+        hit = self._load(url)
+        if hit is None or not (hit[2] or hit[3]):
+            return None
+        return hit[2], hit[3]
+
+    def put(self, url, data, info=None, now=None):
+        """save the data for the url.  info is the headers of the response,
+        if any, from which the validators and max-age are taken."""
+        self._save(url, data, info, now)
+
+    def refresh(self, url, info, now=None):
+        """the server says that the cached data for the url have not changed,
+        so reuse them.  return the cached data."""
+        hit = self._load(url)
+        if hit is None:
+            return None
+        # a 304 response need not repeat the validators
+        self._save(url, hit[1], info, now, hit[2], hit[3], write_data=False)
+        return hit[1]
+
+    def _save(self, url, data, info, now, last_modified=None, etag=None,
+              write_data=True):
+        if now is None:
+            now = time.time()
+        max_age = 0
+        if info is not None:
+            last_modified = info.get('Last-Modified') or last_modified
+            etag = info.get('ETag') or etag
+            max_age = _get_max_age(info)
+        expires_at = int(now + max(self.ttl, max_age))
+        self.mem[url] = (expires_at, data, last_modified, etag)
+        fn, metafn = self._get_paths(url)
+        try:
+            mkdir_p(self.cache_dir)
+            if write_data:
+                with gzip.open(fn, 'wb') as f:
+                    f.write(data)
+            meta = {'fetched_ts': int(now), 'expires_at': expires_at,
+                    'last_modified': last_modified, 'etag': etag}
+            with open(metafn, 'w') as f:
+                f.write(json.dumps(meta))
+        except (IOError, OSError) as e:
+            logerr('cache write failed for %s: %s' % (fn, e))
+
+
+# parsed json objects, keyed by a digest of the raw text, so that an unchanged
+# forecast is not parsed again.  the parsers treat these objects as read-only.
+PARSED_JSON_CACHE_SIZE = 32
+_PARSED_JSON = collections.OrderedDict()
+_PARSED_JSON_LOCK = threading.Lock()
+
+def parse_json(text):
+    """equivalent to json.loads, but reuse the result for identical text"""
+    raw = text if isinstance(text, bytes) else text.encode('utf-8')
+    key = new_digest(raw).digest()
+    with _PARSED_JSON_LOCK:
+        obj = _PARSED_JSON.get(key)
+        if obj is not None:
+            _PARSED_JSON[key] = _PARSED_JSON.pop(key)
+            return obj
+    obj = json.loads(text)
+    with _PARSED_JSON_LOCK:
+        _PARSED_JSON[key] = obj
+        while len(_PARSED_JSON) > PARSED_JSON_CACHE_SIZE:
+            _PARSED_JSON.popitem(last=False)
+    return obj
+
+
 # FIXME: 'method' should be called 'source'
 # FIXME: obvis should be an array?
 # FIXME: add field for tornado, hurricane/cyclone?
@@ -842,7 +1212,24 @@ schema = [('method',     'VARCHAR(10) NOT NULL'),
           ('waveperiod', 'REAL'),
           ]
 
-precip_types = [
+# indexes for the forecast table, as (suffix, columns).  the index name is the
+# table name plus the suffix.  every query for forecasts selects on method and
+# the latest dateTime, and most then select a range of event_ts.
+schema_indexes = [('method_dt', 'method, dateTime, event_ts')]
+
+# the column names in schema order, and the statement used to insert records
+# into a table with the default schema.  the table name is filled in later.
+_SCHEMA_NAMES = tuple([name for name, _ in schema])
+_INSERT_SQL = "insert into %%s (%s) values (%s)" % (
+    ','.join(_SCHEMA_NAMES), ','.join('?' * len(_SCHEMA_NAMES)))
+
+
+def _rec_to_row(rec):
+    """convert a record to a tuple of values in schema order"""
+    return tuple([rec.get(name) for name in _SCHEMA_NAMES])
+
+# the order in which precipitation types are reported
+PRECIP_TYPES_ORDER = (
     'rain',
     'rainshwrs',
     'tstms',
@@ -853,9 +1240,12 @@ precip_types = [
     'sleet',
     'frzngrain',
     'frzngdrzl',
-    'hail']
+    'hail')
+
+# use this for membership tests
+precip_types = frozenset(PRECIP_TYPES_ORDER)
 
-directions_label_dict = {
+directions_label_dict = MappingProxyType({
     'N':   'N',
     'NNE': 'NNE',
     'NE':  'NE',
@@ -871,13 +1261,13 @@ directions_label_dict = {
     'W':   'W',
     'WNW': 'WNW',
     'NW':  'NW',
-    'NNW': 'NNW'}
+    'NNW': 'NNW'})
 
-tide_label_dict = {
+tide_label_dict = MappingProxyType({
     'H': 'High Tide',
-    'L': 'Low Tide'}
+    'L': 'Low Tide'})
 
-weather_label_dict = {
+weather_label_dict = MappingProxyType({
     'temp'      : 'Temperature',
     'dewpt'     : 'Dewpoint',
     'humidity'  : 'Relative Humidity',
@@ -977,7 +1367,18 @@ weather_label_dict = {
     'ZL': 'Freezing Drizzle',  # aeris
     'ZR': 'Freezing Rain',     # aeris
     'ZY': 'Freezing Spray',    # aeris
-    }
+    })
+
+# upper bound of each cloud cover percentage range, and the indicator for it
+CLOUD_COVER_EDGES = (5, 25, 50, 69, 87)
+CLOUD_COVER_CODES = ('CL', 'FW', 'SC', 'B1', 'B2', 'OV')
+# cloud indicator for each integer percentage from 0 to 100
+PCT2CLOUDS = tuple([CLOUD_COVER_CODES[bisect.bisect_left(CLOUD_COVER_EDGES, v)]
+                    for v in range(101)])
+
+# upper bound of each compass sector, in degrees, and the direction for it
+COMPASS_EDGES = (22.5, 65.5, 112.5, 157.5, 202.5, 247.5, 292.5, 337.5)
+COMPASS_CODES = ('N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW', 'N')
 
 DEFAULT_BINDING_DICT = {
     'database': 'forecast_sqlite',
@@ -994,6 +1395,32 @@ class ForecastThread(threading.Thread):
     def run(self):
         self._target(*self._args)
 
+# forecasts run on a pool of worker threads rather than a new thread for each
+# forecast.  each method runs at most one forecast at a time, and the pool has
+# one worker for each method that is bound, so a method that is sleeping (the
+# delay option, or a download or database retry) never holds up another.
+# this is the only concurrency: a forecast downloads, parses and saves
+# synchronously on its worker, so the forecasts of different methods overlap
+# with each other, but the downloads within one forecast do not.  the pool is
+# created on the first forecast, after every service has been loaded.  without
+# concurrent.futures, fall back to a thread per forecast.
+_FORECAST_METHODS = 0
+_FORECAST_POOL = None
+_FORECAST_POOL_LOCK = threading.Lock()
+
+def _add_forecast_method():
+    global _FORECAST_METHODS
+    with _FORECAST_POOL_LOCK:
+        _FORECAST_METHODS += 1
+
+def _get_forecast_pool():
+    global _FORECAST_POOL
+    with _FORECAST_POOL_LOCK:
+        if _FORECAST_POOL is None:
+            _FORECAST_POOL = ThreadPoolExecutor(
+                max_workers=max(1, _FORECAST_METHODS))
+        return _FORECAST_POOL
+
 class Forecast(StdService):
     """Base class for forecasting services."""
 
@@ -1010,62 +1437,84 @@ class Forecast(StdService):
         # these options can be different for each forecast method
 
         # how often to do the forecast
-        self.interval = self._get_opt(d, fid, 'interval', interval)
-        self.interval = int(self.interval)
+        self.interval = self._get_opt(d, fid, 'interval', interval, int)
         # how long to keep forecast records
         self.max_age = self._get_opt(d, fid, 'max_age', max_age)
         self.max_age = self.toint('max_age', self.max_age, None, fid)
+        # how often to remove old forecast records, in seconds
+        self.prune_interval = self._get_opt(
+            d, fid, 'prune_interval', 86400, int)
         # option to vacuum the sqlite database
-        self.vacuum = self._get_opt(d, fid, 'vacuum', False)
-        self.vacuum = weeutil.weeutil.tobool(self.vacuum)
+        self.vacuum = self._get_opt(
+            d, fid, 'vacuum', False, weeutil.weeutil.tobool)
         # how often to retry database failures
-        self.db_max_tries = self._get_opt(d, fid, 'database_max_tries', 3)
-        self.db_max_tries = int(self.db_max_tries)
+        self.db_max_tries = self._get_opt(
+            d, fid, 'database_max_tries', 3, int)
         # how long to wait between retries, in seconds
-        self.db_retry_wait = self._get_opt(d, fid, 'database_retry_wait', 10)
-        self.db_retry_wait = int(self.db_retry_wait)
+        self.db_retry_wait = self._get_opt(
+            d, fid, 'database_retry_wait', 10, int)
         # use single_thread for debugging
-        self.single_thread = self._get_opt(d, fid, 'single_thread', False)
-        self.single_thread = weeutil.weeutil.tobool(self.single_thread)
+        self.single_thread = self._get_opt(
+            d, fid, 'single_thread', False, weeutil.weeutil.tobool)
         # option to save raw forecast to disk
-        self.save_raw = self._get_opt(d, fid, 'save_raw', False)
-        self.save_raw = weeutil.weeutil.tobool(self.save_raw)
+        self.save_raw = self._get_opt(
+            d, fid, 'save_raw', False, weeutil.weeutil.tobool)
         # option to save failed foreast to disk for diagnosis
-        self.save_failed = self._get_opt(d, fid, 'save_failed', False)
-        self.save_failed = weeutil.weeutil.tobool(self.save_failed)
+        self.save_failed = self._get_opt(
+            d, fid, 'save_failed', False, weeutil.weeutil.tobool)
         # where to save the raw forecasts
         self.diag_dir = self._get_opt(d, fid, 'diagnostic_dir', '/var/tmp/fc')
         # how long to wait before doing the forecast
-        self.delay = int(self._get_opt(d, fid, 'delay', 0))
+        self.delay = self._get_opt(d, fid, 'delay', 0, int)
+        # option to use write-ahead logging for sqlite databases
+        self.sqlite_wal = self._get_opt(
+            d, fid, 'sqlite_wal', False, weeutil.weeutil.tobool)
+        # how long to reuse a downloaded forecast, in seconds.  0 to disable.
+        self.cache_ttl = self._get_opt(d, fid, 'cache_ttl', 0, int)
+        # where to keep downloaded forecasts
+        self.cache_dir = self._get_opt(d, fid, 'cache_dir',
+                                       '/var/tmp/weewx-forecast')
+        self.cache = None
+        if self.cache_ttl > 0:
+            self.cache = ForecastCache(self.cache_dir, self.cache_ttl)
 
         self.last_ts = 0
+        self.last_prune_ts = 0
         self.updating = False
         self.last_raw_digest = None
         self.last_fail_digest = None
 
-        # setup database
-        dbm_dict = weewx.manager.get_manager_dict(
+        # setup database.  the bindings do not change, so resolve them once.
+        self.dbm_dict = weewx.manager.get_manager_dict(
             config_dict['DataBindings'], config_dict['Databases'], self.binding,
             default_binding_dict=DEFAULT_BINDING_DICT)
-        with weewx.manager.open_manager(dbm_dict, initialize=True) as dbm:
+        with weewx.manager.open_manager(self.dbm_dict, initialize=True) as dbm:
             # ensure schema on disk matches schema in memory
             dbcol = dbm.connection.columnsOf(dbm.table_name)
-            memcol = [x[0] for x in dbm_dict['schema']]
+            if self.dbm_dict['schema'] is schema:
+                memcol = list(_SCHEMA_NAMES)
+            else:
+                memcol = [x[0] for x in self.dbm_dict['schema']]
             if dbcol != memcol:
                 raise Exception('%s: schema mismatch: %s != %s' %
                                 (self.method_id, dbcol, memcol))
+            Forecast.create_indexes(dbm, self.method_id)
             # find out when the last forecast happened
-            self.last_ts = Forecast.get_last_forecast_ts(dbm, self.method_id)
+            # with no previous forecast, do the first one right away
+            self.last_ts = Forecast.get_last_forecast_ts(
+                dbm, self.method_id) or 0
 
     def _bind(self):
         # ensure that the forecast has a chance to update on each new record
         self.bind(weewx.NEW_ARCHIVE_RECORD, self.update_forecast)
-
-    def _get_opt(self, d, fid, label, default_v):
-        """get an option from dict, prefer specialized value if one exists"""
-        v = d.get(label, default_v)
-        dd = d.get(fid, {})
-        v = dd.get(label, v)
+        _add_forecast_method()
+
+    def _get_opt(self, d, fid, label, default_v, coerce=None):
+        """get an option from dict, prefer specialized value if one exists.
+        if a coerce function is specified, apply it to the value."""
+        v = d.get(fid, {}).get(label, d.get(label, default_v))
+        if coerce is not None:
+            v = coerce(v)
         return v
 
     @staticmethod
@@ -1084,12 +1533,11 @@ class Forecast(StdService):
     @staticmethod
     def get_masked_url(url, api_key):
         """look for specified key in the url and mask all but 4 characters"""
-        masked = list(url)
+        n = len(api_key) - 4
         idx = url.find(api_key)
-        if idx >= 0:
-            for i in range(len(api_key) - 4):
-                masked[idx + i] = 'X'
-        return ''.join(masked)
+        if idx < 0 or n <= 0:
+            return url
+        return url[:idx] + 'X' * n + url[idx + n:]
 
     @staticmethod
     def toint(label, value, default_value, method):
@@ -1132,18 +1580,8 @@ class Forecast(StdService):
             v = int(value)
         except (ValueError, TypeError):
             return None
-        if 0 <= v <= 5:
-            return 'CL'
-        elif 5 < v <= 25:
-            return 'FW'
-        elif 25 < v <= 50:
-            return 'SC'
-        elif 50 < v <= 69:
-            return 'B1'
-        elif 69 < v <= 87:
-            return 'B2'
-        elif 87 < v <= 100:
-            return 'OV'
+        if 0 <= v <= 100:
+            return PCT2CLOUDS[v]
         return None
 
     @staticmethod
@@ -1153,24 +1591,8 @@ class Forecast(StdService):
             v = float(value)
         except (ValueError, TypeError):
             return None
-        if 0 <= v <= 22.5:
-            return 'N'
-        elif 22.5 < v <= 65.5:
-            return 'NE'
-        elif 65.5 < v <= 112.5:
-            return 'E'
-        elif 112.5 < v <= 157.5:
-            return 'SE'
-        elif 157.5 < v <= 202.5:
-            return 'S'
-        elif 202.5 < v <= 247.5:
-            return 'SW'
-        elif 247.5 < v <= 292.5:
-            return 'W'
-        elif 292.5 < v <= 337.5:
-            return 'NW'
-        elif 337.5 < v <= 360:
-            return 'N'
+        if 0 <= v <= 360:
+            return COMPASS_CODES[bisect.bisect_left(COMPASS_EDGES, v)]
         return None
 
     @staticmethod
@@ -1180,25 +1602,24 @@ class Forecast(StdService):
         tstr = time.strftime('%Y%m%d%H%M', time.localtime(ts))
         mkdir_p(dirname)
         fn = '%s/%s-%s' % (dirname, basename, tstr)
-        with open(fn, 'w') as f:
-            if msgs is not None:
-                for m in msgs:
-                    f.write("%s\n" % m)
-            f.write(fc)
+        # assemble everything first so the file is written with one call
+        data = ''.join(["%s\n" % m for m in msgs or []]).encode('utf-8')
+        if not isinstance(fc, bytes):
+            fc = fc.encode('utf-8')
+        with open(fn, 'wb') as f:
+            f.write(data + fc)
 
     def save_raw_forecast(self, fc, basename='raw', msgs=None):
-        m = hashlib.md5()
-        m.update(fc)
-        digest = m.hexdigest()
+        # this only has to tell whether the forecast changed since the last
+        # one we saved, within this process, so the builtin hash is enough
+        digest = (len(fc), hash(fc))
         if self.last_raw_digest == digest:
             return
         Forecast.save_fc_data(fc, self.diag_dir, basename=basename, msgs=msgs)
         self.last_raw_digest = digest
 
     def save_failed_forecast(self, fc, basename='fail', msgs=None):
-        m = hashlib.md5()
-        m.update(fc)
-        digest = m.hexdigest()
+        digest = (len(fc), hash(fc))
         if self.last_fail_digest == digest:
             return
         Forecast.save_fc_data(fc, self.diag_dir, basename=basename, msgs=msgs)
@@ -1208,14 +1629,33 @@ class Forecast(StdService):
         if self.single_thread:
             self.do_forecast(event)
         elif self.updating:
-            logdbg('%s: update thread already running' % self.method_id)
+            logdbg('%s: update thread already running', self.method_id)
         elif time.time() - self.interval > self.last_ts:
-            t = ForecastThread(self.do_forecast, event)
-            t.setName(self.method_id + 'Thread')
-            logdbg('%s: starting thread' % self.method_id)
-            t.start()
+            if ThreadPoolExecutor is not None:
+                logdbg('%s: submitting forecast', self.method_id)
+                # mark as updating now so the next record does not submit
+                # another forecast before this one starts
+                self.updating = True
+                try:
+                    _get_forecast_pool().submit(self.run_forecast, event)
+                except Exception as e:
+                    # nothing will run, so let the next record try again
+                    self.updating = False
+                    logerr('%s: cannot submit forecast: %s' %
+                           (self.method_id, e))
+            else:
+                t = ForecastThread(self.do_forecast, event)
+                t.setName(self.method_id + 'Thread')
+                logdbg('%s: starting thread', self.method_id)
+                t.start()
         else:
-            logdbg('%s: not yet time to do the forecast' % self.method_id)
+            logdbg('%s: not yet time to do the forecast', self.method_id)
+
+    def run_forecast(self, event):
+        # name the pool thread after the method so that log messages show
+        # which forecast they came from
+        threading.currentThread().setName(self.method_id + 'Thread')
+        self.do_forecast(event)
 
     def do_forecast(self, event):
         self.updating = True
@@ -1225,27 +1665,26 @@ class Forecast(StdService):
             records = self.get_forecast(event)
             if records is None:
                 return
-            dbm_dict = weewx.manager.get_manager_dict(
-                self.config_dict['DataBindings'],
-                self.config_dict['Databases'],
-                self.binding,
-                default_binding_dict=DEFAULT_BINDING_DICT)
-            with weewx.manager.open_manager(dbm_dict) as dbm:
+            with weewx.manager.open_manager(self.dbm_dict) as dbm:
+                if self.sqlite_wal:
+                    Forecast.set_sqlite_wal(dbm, self.method_id)
                 Forecast.save_forecast(dbm, records, self.method_id,
                                        self.db_max_tries, self.db_retry_wait)
                 self.last_ts = int(time.time())
-                if self.max_age is not None:
+                if (self.max_age is not None and
+                    self.last_ts - self.last_prune_ts >= self.prune_interval):
                     Forecast.prune_forecasts(dbm, self.method_id,
                                              self.last_ts - self.max_age,
                                              self.db_max_tries,
                                              self.db_retry_wait)
-                if self.vacuum:
-                    Forecast.vacuum_database(dbm, self.method_id)
+                    self.last_prune_ts = self.last_ts
+                    if self.vacuum:
+                        Forecast.vacuum_database(dbm, self.method_id)
         except Exception as e:
             logerr('%s: forecast failure: %s' % (self.method_id, e))
             weeutil.weeutil.log_traceback(loglevel=syslog.LOG_DEBUG)
         finally:
-            logdbg('%s: terminating thread' % self.method_id)
+            logdbg('%s: terminating thread', self.method_id)
             self.updating = False
 
     def get_forecast(self, event):
@@ -1254,57 +1693,136 @@ class Forecast(StdService):
 
     @staticmethod
     def get_last_forecast_ts(dbm, method_id):
-        sql = "select dateTime,issued_ts from %s where method = '%s' and dateTime = (select max(dateTime) from %s where method = '%s') limit 1" % (dbm.table_name, method_id, dbm.table_name, method_id)
-#        sql = "select max(dateTime),issued_ts from %s where method = '%s'" % (table, method_id)
-        r = dbm.getSql(sql)
+        sql = "select dateTime,issued_ts from %s where method = ? and dateTime = (select max(dateTime) from %s where method = ?) limit 1" % (dbm.table_name, dbm.table_name)
+#        sql = "select max(dateTime),issued_ts from %s where method = ?" % table
+        r = dbm.getSql(sql, (method_id, method_id))
         if r is None:
             return None
-        logdbg('%s: last forecast issued %s, requested %s' %
-               (method_id,
-                weeutil.weeutil.timestamp_to_string(r[1]),
-                weeutil.weeutil.timestamp_to_string(r[0])))
+        logdbg('%s: last forecast issued %s, requested %s', method_id,
+               weeutil.weeutil.timestamp_to_string(r[1]),
+               weeutil.weeutil.timestamp_to_string(r[0]))
         return int(r[0])
 
     @staticmethod
     def save_forecast(dbm, records, method_id, max_tries=3, retry_wait=10):
         for count in range(max_tries):
             try:
-                logdbg('%s: saving %d forecast records' %
-                       (method_id, len(records)))
-                dbm.addRecord(records, log_level=syslog.LOG_DEBUG)
-                loginf('%s: saved %d forecast records' %
-                       (method_id, len(records)))
+                logdbg('%s: saving %d forecast records',
+                       method_id, len(records))
+                n = Forecast.insert_records(dbm, records, method_id)
+                loginf('%s: saved %d forecast records' % (method_id, n))
                 break
-            except weedb.DatabaseError as e:
+            except (weedb.DatabaseError, sqlite3.Error) as e:
                 logerr('%s: save failed (attempt %d of %d): %s' %
                        (method_id, (count + 1), max_tries, e))
-                logdbg('%s: waiting %d seconds before retry' %
-                       (method_id, retry_wait))
-                time.sleep(retry_wait)
+                if count + 1 < max_tries:
+                    logdbg('%s: waiting %d seconds before retry',
+                           method_id, retry_wait)
+                    time.sleep(retry_wait)
         else:
             raise Exception('save failed after %d attempts' % max_tries)
 
+    @staticmethod
+    def insert_records(dbm, records, method_id='Forecast'):
+        """insert the records using a single statement in a single
+        transaction.  this is much faster than adding the records one at a
+        time, since there is only one commit.  if the database rejects a
+        record, for example because a required value is missing, the whole
+        batch is rolled back, so insert the records one at a time instead and
+        skip the ones that are rejected, as addRecord does.  return the
+        number of records that were inserted."""
+        keys = tuple(dbm.sqlkeys)
+        if keys == _SCHEMA_NAMES:
+            sql = _INSERT_SQL % dbm.table_name
+            rows = [_rec_to_row(r) for r in records]
+        else:
+            # the table was created with some other schema
+            sql = "insert into %s (%s) values (%s)" % (
+                dbm.table_name, ','.join(keys), ','.join('?' * len(keys)))
+            rows = [tuple([r.get(k) for k in keys]) for r in records]
+        try:
+            with weedb.Transaction(dbm.connection) as cursor:
+                if hasattr(cursor, 'executemany'):
+                    cursor.executemany(sql, rows)
+                else:
+                    # the weedb mysql cursor has no executemany
+                    for row in rows:
+                        cursor.execute(sql, row)
+            return len(rows)
+        except (weedb.IntegrityError, sqlite3.IntegrityError) as e:
+            logerr('%s: cannot insert records as a batch: %s' % (method_id, e))
+        count = 0
+        with weedb.Transaction(dbm.connection) as cursor:
+            for i, row in enumerate(rows):
+                try:
+                    cursor.execute(sql, row)
+                    count += 1
+                except (weedb.IntegrityError, sqlite3.IntegrityError) as e:
+                    logerr('%s: unable to add record %d: %s' %
+                           (method_id, i + 1, e))
+        return count
+
+    @staticmethod
+    def set_sqlite_wal(dbm, method_id):
+        """use write-ahead logging with normal sync for sqlite databases.
+        this reduces the number of fsyncs per save.  it is silently ignored
+        for any other type of database."""
+        if getattr(dbm.connection, 'dbtype', None) != 'sqlite':
+            return
+        try:
+            dbm.getSql('pragma journal_mode=WAL')
+            dbm.getSql('pragma synchronous=NORMAL')
+        except weedb.DatabaseError as e:
+            logdbg('%s: cannot set journal mode: %s', method_id, e)
+
     @staticmethod
     def prune_forecasts(dbm, method_id, ts, max_tries=3, retry_wait=10):
         """remove forecasts older than ts from the database"""
 
-        sql = "delete from %s where method = '%s' and dateTime < %d" % (
-            dbm.table_name, method_id, ts)
+        sql = "delete from %s where method = ? and dateTime < ?" % (
+            dbm.table_name)
         for count in range(max_tries):
             try:
-                logdbg('%s: deleting forecasts prior to %d' % (method_id, ts))
-                dbm.getSql(sql)
+                logdbg('%s: deleting forecasts prior to %d', method_id, ts)
+                dbm.getSql(sql, (method_id, int(ts)))
                 loginf('%s: deleted forecasts prior to %d' % (method_id, ts))
                 break
             except weedb.DatabaseError as e:
                 logerr('%s: prune failed (attempt %d of %d): %s' %
                        (method_id, (count + 1), max_tries, e))
-                logdbg('%s: waiting %d seconds before retry' %
-                       (method_id, retry_wait))
-                time.sleep(retry_wait)
+                if count + 1 < max_tries:
+                    logdbg('%s: waiting %d seconds before retry',
+                           method_id, retry_wait)
+                    time.sleep(retry_wait)
         else:
             raise Exception('prune failed after %d attemps' % max_tries)
 
+    @staticmethod
+    def create_indexes(dbm, method_id):
+        """create the indexes for the forecast table if they do not exist.
+        mysql does not accept 'if not exists' for an index, so for mysql
+        look for the index first."""
+        sqlite = getattr(dbm.connection, 'dbtype', None) == 'sqlite'
+        for suffix, columns in schema_indexes:
+            name = '%s_%s' % (dbm.table_name, suffix)
+            try:
+                if sqlite:
+                    sql = "create index if not exists %s on %s (%s)" % (
+                        name, dbm.table_name, columns)
+                else:
+                    r = dbm.getSql(
+                        "select count(*) from information_schema.statistics"
+                        " where table_schema = database()"
+                        " and table_name = ? and index_name = ?",
+                        (dbm.table_name, name))
+                    if r is not None and r[0]:
+                        continue
+                    sql = "create index %s on %s (%s)" % (
+                        name, dbm.table_name, columns)
+                dbm.getSql(sql)
+            except weedb.DatabaseError as e:
+                logdbg('%s: create index failed: %s', method_id, e)
+
     @staticmethod
     def vacuum_database(dbm, method_id):
         # vacuum will only work on sqlite databases.  it will compact the
@@ -1312,10 +1830,10 @@ class Forecast(StdService):
         # we prune records from the database.  it should be ok to run this
         # on a mysql database - it will silently fail.
         try:
-            logdbg('%s: vacuuming the database' % method_id)
+            logdbg('%s: vacuuming the database', method_id)
             dbm.getSql('vacuum')
         except weedb.DatabaseError as e:
-            logdbg('%s: vacuuming failed: %s' % (method_id, e))
+            logdbg('%s: vacuuming failed: %s', method_id, e)
 
     # this method is used only by the unit tests
     @staticmethod
@@ -1324,12 +1842,13 @@ class Forecast(StdService):
 
         since_ts - timestamp, in seconds.  a value of None will return all.
         """
-        sql = "select * from %s where method = '%s'" % (
-            dbm.table_name, method_id)
+        sql = "select * from %s where method = ?" % dbm.table_name
+        args = [method_id]
         if since_ts is not None:
-            sql += " and dateTime > %d" % since_ts
+            sql += " and dateTime > ?"
+            args.append(int(since_ts))
         records = []
-        for r in dbm.genSql(sql):
+        for r in dbm.genSql(sql, tuple(args)):
             records.append(r)
         return records
 
@@ -1377,8 +1896,12 @@ class ZambrettiForecast(Forecast):
         self.upper_pressure = float(d.get('upper_pressure', 1050.0))
         self.winddir_period = int(d.get('winddir_period', 1800))
         self.pressure_period = int(d.get('pressure_period', 10800))
+        # look up the conversion from inHg to mbar only once
+        self.inHg_to_mbar = weewx.units.conversionDict['inHg']['mbar']
         # keep track of the last time for which we issued a forecast
         self.last_event_ts = 0
+        # the archive bindings, resolved on first use
+        self.wx_dbm_dict = None
         loginf('%s: interval=%s max_age=%s winddir_period=%s pressure_period=%s hemisphere=%s lower_pressure=%s upper_pressure=%s' %
                (Z_KEY, self.interval, self.max_age,
                 self.winddir_period, self.pressure_period,
@@ -1393,64 +1916,60 @@ class ZambrettiForecast(Forecast):
         if now < ts:
             ts -= 86400
         if self.last_event_ts == ts:
-            logdbg('%s: forecast was already calculated for %s' %
-                   (Z_KEY, weeutil.weeutil.timestamp_to_string(ts)))
+            logdbg('%s: forecast was already calculated for %s',
+                   Z_KEY, weeutil.weeutil.timestamp_to_string(ts))
             return None
 
-        logdbg('%s: generating forecast for %s' %
-               (Z_KEY, weeutil.weeutil.timestamp_to_string(ts)))
-        logdbg('%s: using winddir from %s to %s' %
-               (Z_KEY,
-                weeutil.weeutil.timestamp_to_string(ts - self.winddir_period),
-                weeutil.weeutil.timestamp_to_string(ts)))
-        logdbg('%s: using pressure from %s to %s' %
-               (Z_KEY,
-                weeutil.weeutil.timestamp_to_string(ts - self.pressure_period),
-                weeutil.weeutil.timestamp_to_string(ts)))
+        logdbg('%s: generating forecast for %s',
+               Z_KEY, weeutil.weeutil.timestamp_to_string(ts))
+        logdbg('%s: using winddir from %s to %s', Z_KEY,
+               weeutil.weeutil.timestamp_to_string(ts - self.winddir_period),
+               weeutil.weeutil.timestamp_to_string(ts))
+        logdbg('%s: using pressure from %s to %s', Z_KEY,
+               weeutil.weeutil.timestamp_to_string(ts - self.pressure_period),
+               weeutil.weeutil.timestamp_to_string(ts))
 
         try:
-            dbm_dict = weewx.manager.get_manager_dict(
-                self.config_dict['DataBindings'],
-                self.config_dict['Databases'],
-                'wx_binding')
-            with weewx.manager.open_manager(dbm_dict) as dbm:
-                r = dbm.getSql('SELECT usUnits FROM %s LIMIT 1' %
-                               dbm.table_name)
-                units = r[0]
-                r = dbm.getSql('SELECT AVG(windDir) FROM %s '
-                               'WHERE dateTime >= %s AND dateTime <= %s' %
-                               (dbm.table_name, ts - self.winddir_period, ts))
-                winddir = r[0]
-                r = dbm.getSql('SELECT AVG(barometer) FROM %s '
-                               'WHERE dateTime >= %s AND dateTime <= %s' %
-                               (dbm.table_name, ts - self.pressure_period, ts))
-                pressure = r[0]
-                r = dbm.getSql('SELECT MIN(dateTime),barometer FROM %s '
-                               'WHERE dateTime >= %s AND dateTime <= %s' %
-                               (dbm.table_name, ts - self.pressure_period, ts))
-                first_p = r[1]
-                r = dbm.getSql('SELECT MAX(dateTime),barometer FROM %s '
-                               'WHERE dateTime >= %s AND dateTime <= %s' %
-                               (dbm.table_name, ts - self.pressure_period, ts))
-                last_p = r[1]
+            if self.wx_dbm_dict is None:
+                self.wx_dbm_dict = weewx.manager.get_manager_dict(
+                    self.config_dict['DataBindings'],
+                    self.config_dict['Databases'],
+                    'wx_binding')
+            with weewx.manager.open_manager(self.wx_dbm_dict) as dbm:
+                # get everything in one query.  the averages use only the
+                # records in their own period, and the first and last
+                # pressures give the trend over the pressure period.
+                sts = min(ts - self.winddir_period, ts - self.pressure_period)
+                sql = ("SELECT (SELECT usUnits FROM {t} LIMIT 1),"
+                       " AVG(CASE WHEN dateTime >= ? THEN windDir END),"
+                       " AVG(CASE WHEN dateTime >= ? THEN barometer END),"
+                       " (SELECT barometer FROM {t}"
+                       "  WHERE dateTime >= ? AND dateTime <= ?"
+                       "  ORDER BY dateTime ASC LIMIT 1),"
+                       " (SELECT barometer FROM {t}"
+                       "  WHERE dateTime >= ? AND dateTime <= ?"
+                       "  ORDER BY dateTime DESC LIMIT 1)"
+                       " FROM {t} WHERE dateTime >= ? AND dateTime <= ?"
+                       ).format(t=dbm.table_name)
+                pts = ts - self.pressure_period
+                r = dbm.getSql(sql, (ts - self.winddir_period, pts,
+                                     pts, ts, pts, ts, sts, ts))
+                units, winddir, pressure, first_p, last_p = r
         except weedb.DatabaseError as e:
             loginf('%s: skipping forecast: %s' % (Z_KEY, e))
             return None
 
-        logdbg('%s: units=%s winddir=%s pressure=%s first_p=%s last_p=%s'
-               % (Z_KEY, units, winddir, pressure, first_p, last_p))
+        logdbg('%s: units=%s winddir=%s pressure=%s first_p=%s last_p=%s',
+               Z_KEY, units, winddir, pressure, first_p, last_p)
 
         # pressures need to be in mbar
         if units == weewx.US:
             if pressure is not None:
-                vt = (float(pressure), "inHg", "group_pressure")
-                pressure = weewx.units.convert(vt, 'mbar')[0]
+                pressure = self.inHg_to_mbar(float(pressure))
             if first_p is not None:
-                vt = (float(first_p), "inHg", "group_pressure")
-                first_p = weewx.units.convert(vt, 'mbar')[0]
+                first_p = self.inHg_to_mbar(float(first_p))
             if last_p is not None:
-                vt = (float(last_p), "inHg", "group_pressure")
-                last_p = weewx.units.convert(vt, 'mbar')[0]
+                last_p = self.inHg_to_mbar(float(last_p))
 
         # for trend we need mbar per hour
         trend = None
@@ -1466,12 +1985,12 @@ class ZambrettiForecast(Forecast):
         tt = time.gmtime(ts)
         month = tt.tm_mon - 1  # month is [0-11]
         north = self.hemisphere.lower() != 'south'
-        logdbg('%s: pressure=%s month=%s winddir=%s trend=%s north=%s' %
-               (Z_KEY, pressure, month, winddir, trend, north))
+        logdbg('%s: pressure=%s month=%s winddir=%s trend=%s north=%s',
+               Z_KEY, pressure, month, winddir, trend, north)
         code = ZambrettiCode(pressure, month, winddir, trend, north,
                              baro_bottom=self.lower_pressure,
                              baro_top=self.upper_pressure)
-        logdbg('%s: code is %s' % (Z_KEY, code))
+        logdbg('%s: code is %s', Z_KEY, code)
         if code is None:
             return None
 
@@ -1486,7 +2005,7 @@ class ZambrettiForecast(Forecast):
         loginf('%s: generated 1 forecast record' % Z_KEY)
         return [record]
 
-zambretti_label_dict = {
+zambretti_label_dict = MappingProxyType({
     'A': "Settled fine",
     'B': "Fine weather",
     'C': "Becoming fine",
@@ -1513,11 +2032,30 @@ zambretti_label_dict = {
     'X': "Rain, very unsettled",
     'Y': "Stormy, may improve",
     'Z': "Stormy, much rain",
-}
+})
 
 def ZambrettiText(code):
     return zambretti_label_dict[code]
 
+
+# coefficients for each pressure trend: the slope and offset that map the
+# pressure to an index, the summer adjustment to the pressure, and the table
+# of codes for the index.
+ZAMBRETTI_RISING = (
+    0.1740, 1031.40, 3.2,
+    ('A','B','B','C','F','G','I','J','L','M','M','Q','T','Y'))
+ZAMBRETTI_FALLING = (
+    0.1553, 1029.95, -3.2,
+    ('B','D','H','O','R','U','V','X','X','Z'))
+ZAMBRETTI_STEADY = (
+    0.2314, 1030.81, 0.0,
+    ('A','B','B','B','E','K','N','N','P','P','S','W','W','X','X','X','Z'))
+# pressure adjustment for each of the 16 wind directions, from N clockwise
+ZAMBRETTI_WIND_ADJ = (
+      5.2,  4.2,  3.2,  1.05, -1.1, -3.15, -5.2, -8.35,
+    -11.5, -9.4, -7.3, -5.25, -3.2, -1.15,  0.9,  3.05)
+
+
 def ZambrettiCode(pressure, month, wind, trend,
                   north=True, baro_top=1050.0, baro_bottom=950.0):
     """Simple implementation of Zambretti forecaster algorithm based on
@@ -1550,25 +2088,17 @@ def ZambrettiCode(pressure, month, wind, trend,
         if not north:
             # southern hemisphere, so add 180 degrees
             wind = (wind + 8) % 16
-        pressure += (  5.2,  4.2,  3.2,  1.05, -1.1, -3.15, -5.2, -8.35,
-                     -11.5, -9.4, -7.3, -5.25, -3.2, -1.15,  0.9,  3.05)[wind]
+        pressure += ZAMBRETTI_WIND_ADJ[wind]
     # compute base forecast from pressure and trend (hPa / hour)
     if trend >= 0.1:
-        # rising pressure
-        if north == (month >= 4 and month <= 9):
-            pressure += 3.2
-        F = 0.1740 * (1031.40 - pressure)
-        LUT = ('A','B','B','C','F','G','I','J','L','M','M','Q','T','Y')
+        k, c, adj, LUT = ZAMBRETTI_RISING
     elif trend <= -0.1:
-        # falling pressure
-        if north == (month >= 4 and month <= 9):
-            pressure -= 3.2
-        F = 0.1553 * (1029.95 - pressure)
-        LUT = ('B','D','H','O','R','U','V','X','X','Z')
+        k, c, adj, LUT = ZAMBRETTI_FALLING
     else:
-        # steady
-        F = 0.2314 * (1030.81 - pressure)
-        LUT = ('A','B','B','B','E','K','N','N','P','P','S','W','W','X','X','X','Z')
+        k, c, adj, LUT = ZAMBRETTI_STEADY
+    if adj and north == (4 <= month <= 9):
+        pressure += adj
+    F = k * (c - pressure)
     # clip to range of lookup table
     F = min(max(int(F + 0.5), 0), len(LUT) - 1)
     # convert to letter code
@@ -1701,6 +2231,9 @@ class NWSForecast(Forecast):
         self.max_tries = int(d.get('max_tries', 3))
         self.lid = d.get('lid', None)
         self.foid = d.get('foid', None)
+        # digest of the last product and the matrix parsed from it
+        self.last_digest = None
+        self.last_matrix = None
 
         errmsg = []
         if self.lid is None or self.lid.startswith('INSERT_'):
@@ -1719,19 +2252,29 @@ class NWSForecast(Forecast):
 
     def get_forecast(self, dummy_event):
         text = NWSDownloadForecast(self.foid, url=self.url,
-                                   max_tries=self.max_tries)
+                                   max_tries=self.max_tries, cache=self.cache)
         if text is None:
             logerr('%s: no PFM data for %s from %s' %
                    (NWS_KEY, self.foid, self.url))
             return None
         if self.save_raw:
             self.save_raw_forecast(text, basename='nws-raw')
-        matrix = NWSParseForecast(text, self.lid)
+        # the product changes only a few times a day, so parse it only if it
+        # differs from the last one.  the records are always rebuilt so that
+        # they carry the time of this forecast.
+        raw = text if isinstance(text, bytes) else text.encode('utf-8')
+        digest = new_digest(raw).digest()
+        if digest == self.last_digest:
+            matrix = self.last_matrix
+        else:
+            matrix = NWSParseForecast(text, self.lid)
+            self.last_digest = digest
+            self.last_matrix = matrix
         if matrix is None:
             logerr('%s: no PFM found for %s in forecast from %s' %
                    (NWS_KEY, self.lid, self.foid))
             return None
-        logdbg('%s: forecast matrix: %s' % (NWS_KEY, matrix))
+        logdbg('%s: forecast matrix: %s', NWS_KEY, matrix)
         records = NWSProcessForecast(self.foid, self.lid, matrix)
         if len(records) == 0 and self.save_failed:
             self.save_failed_forecast(text, basename='nws-fail')
@@ -1743,7 +2286,7 @@ class NWSForecast(Forecast):
         return records
 
 # mapping of NWS names to database fields
-nws_schema_dict = {
+nws_schema_dict = MappingProxyType({
     'HOUR'      : 'hour',
     'MIN/MAX'   : 'tempMinMax',
     'MAX/MIN'   : 'tempMaxMin',
@@ -1775,9 +2318,13 @@ nws_schema_dict = {
     'OBVIS'     : 'obvis',
     'WIND CHILL': 'windChill',
     'HEAT INDEX': 'heatIndex',
-}
+})
+
+# the hours in a 6-hour row are separated by whitespace
+PFM_HOUR_RE = re.compile(r'\S+')
 
-def NWSDownloadForecast(foid, url=NWS_DEFAULT_PFM_URL, max_tries=3):
+def NWSDownloadForecast(foid, url=NWS_DEFAULT_PFM_URL, max_tries=3,
+                        cache=None):
     """Download a point forecast matrix from the US National Weather Service"""
 
     u = url
@@ -1786,33 +2333,26 @@ def NWSDownloadForecast(foid, url=NWS_DEFAULT_PFM_URL, max_tries=3):
     elif url == NWS_DEFAULT_PFM_URL_v3:
         u = url % foid
     loginf("%s: downloading forecast from '%s'" % (NWS_KEY, u))
-    for count in range(max_tries):
-        try:
-            response = urlopen(u)
-            text = response.read()
-            return text
-        except (socket.error, URLError, BadStatusLine, IncompleteRead) as e:
-            logerr('%s: failed attempt %d to download NWS forecast: %s' %
-                   (NWS_KEY, count + 1, e))
-    else:
-        logerr('%s: failed to download forecast' % NWS_KEY)
-    return None
+    return download_url(u, NWS_KEY, max_tries=max_tries, cache=cache)
 
 def NWSExtractLocation(text, lid):
     """Extract a single location from a US National Weather Service PFM."""
 
-    alllines = text.splitlines()
-    lines = None
-    for line in iter(alllines):
-        if line.startswith(lid):
-            lines = []
-            lines.append(line)
-        elif lines is not None:
-            if line.startswith('$$'):
-                break
-            else:
-                lines.append(line)
-    return lines
+    # find the first line that starts with the location id, then the end of
+    # that section.  if the id starts another line before the end, the
+    # section starts at the last of those lines.
+    i = 0
+    if not text.startswith(lid):
+        i = text.find('\n' + lid) + 1
+        if i == 0:
+            return None
+    j = text.find('\n$$', i) + 1
+    if j == 0:
+        j = len(text)
+    k = text.rfind('\n' + lid, i, j)
+    if k >= 0:
+        i = k + 1
+    return text[i:j].splitlines()
 
 def NWSParseForecast(text, lid):
     """Parse a United States National Weather Service point forcast matrix.
@@ -1820,6 +2360,10 @@ def NWSParseForecast(text, lid):
     etc. extracted from the point forecast.
     """
 
+    if isinstance(text, bytes) and not isinstance(text, str):
+        # the download is bytes on python 3.  decode the whole product once
+        # rather than each line and label within it.
+        text = text.decode('utf-8', 'replace')
     lines = NWSExtractLocation(text, lid)
     if lines is None:
         return None
@@ -1830,7 +2374,9 @@ def NWSParseForecast(text, lid):
     mode = None
 
     for line in lines:
-        if ts is None and len(line.split(' ')) == 7:
+        # the issued time is the only line with exactly six single spaces.
+        # count them rather than splitting the line into a list.
+        if ts is None and line.count(' ') == 6:
             ts = date2ts(line)
             continue
         label = line[0:14].strip().upper()
@@ -1846,16 +2392,17 @@ def NWSParseForecast(text, lid):
         elif label.endswith('-'):
             label = label[:-1].strip()
             prefix = '-'
-        if label in nws_schema_dict:
-            row = "%s%s" % (prefix, line[14:])
+        field = nws_schema_dict.get(label)
+        if field is not None:
+            row = prefix + line[14:]
             if mode == 3:
-                rows3[nws_schema_dict[label]] = row
+                rows3[field] = row
             elif mode == 6:
-                rows6[nws_schema_dict[label]] = row
+                rows6[field] = row
             else:
                 loginf("%s: mode unset for label '%s'" % (NWS_KEY, label))
         else:
-            logdbg("%s: ignore label '%s'" % (NWS_KEY, label))
+            logdbg("%s: ignore label '%s'", NWS_KEY, label)
 
     if ts is None:
         loginf("%s: no time string found for %s" % (NWS_KEY, lid))
@@ -1893,107 +2440,114 @@ def NWSParseForecast(text, lid):
     # get the 6-hour indexing
     indices6 = {} # index in the hour string mapped to index of the hour
     idx2hr6 = []  # index of the hour mapped to location in the hour string
-    s = ''
-    for i in range(0, len(rows6['hour'])):
-        if rows6['hour'][i].isspace():
-            if len(s) > 0:
-                h = int(s)
-                if lasth is not None and h < lasth:
-                    day += 24 * 3600
-                lasth = h
-                matrix['ts'].append(day + h * 3600)
-                matrix['hour'].append(h)
-                matrix['duration'].append(6 * 3600)
-                indices6[i - 1] = idx
-                idx += 1
-                idx2hr6.append(i - 1)
-            s = ''
+    row = rows6['hour']
+    for m in PFM_HOUR_RE.finditer(row):
+        h = int(m.group())
+        i = m.end() - 1 # the hour is right-aligned on its last digit
+        if m.end() == len(row):
+            # an hour that runs to the end of the line
+            matrix['ts'].append(day + h * 3600)
+            matrix['hour'].append(h)
+            matrix['duration'].append(3 * 3600)
         else:
-            s += rows6['hour'][i]
-    if len(s) > 0:
-        h = int(s)
-        matrix['ts'].append(day + h * 3600)
-        matrix['hour'].append(h)
-        matrix['duration'].append(3 * 3600)
-        indices6[len(rows6['hour']) - 1] = idx
+            if lasth is not None and h < lasth:
+                day += 24 * 3600
+            lasth = h
+            matrix['ts'].append(day + h * 3600)
+            matrix['hour'].append(h)
+            matrix['duration'].append(6 * 3600)
+        indices6[i] = idx
         idx += 1
-        idx2hr6.append(len(rows6['hour']) - 1)
+        idx2hr6.append(i)
 
     # get the 3 and 6 hour data
     filldata(matrix, idx, rows3, indices3, idx2hr3)
     filldata(matrix, idx, rows6, indices6, idx2hr6)
     return matrix
 
+@lru_cache(maxsize=64)
+def _pfm_columns(i2h, width):
+    """return a tuple of (start, stop, i) tuples, one for each column of a
+    row with fields of the indicated width.  i is the location of the hour in
+    the hour string.  the fields are right-aligned with the hours.  fields
+    wider than 3 characters span 12 hours, so only every 4th column (counting
+    back from the last) has a value.  i2h must be a tuple so that the column
+    layout, which rarely changes from one forecast to the next, is cached."""
+    return tuple((max(0, i - width + 1), i + 1, i)
+                 for q, i in enumerate(reversed(i2h))
+                 if width == 3 or q % 4 == 0)
+
 def filldata(matrix, nidx, rows, indices, i2h):
     """fill matrix with data from rows"""
     n = {'qpf': 8, 'qsf': 5} # field widths
+    i2h = tuple(i2h)
     for label in rows:
         if label not in matrix:
             matrix[label] = [None] * nidx
         l = n.get(label, 3) # default to field width of 3
-        q = 0
-        for i in reversed(i2h):
-            if l == 3 or q % 4 == 0:
-                s = 0 if i - l + 1 < 0 else i - l + 1
-                chunk = rows[label][s:i + 1].strip()
-                if len(chunk) > 0:
-                    matrix[label][indices[i]] = chunk
-            q += 1
+        row = rows[label]
+        values = matrix[label]
+        for start, stop, i in _pfm_columns(i2h, l):
+            chunk = row[start:stop].strip()
+            if chunk:
+                values[indices[i]] = chunk
 
     # deal with min/max temperatures
     if 'tempMin' not in matrix:
         matrix['tempMin'] = [None] * nidx
     if 'tempMax' not in matrix:
         matrix['tempMax'] = [None] * nidx
-    if 'tempMinMax' in matrix:
-        state = 0
-        for i in range(nidx):
-            if matrix['tempMinMax'][i] is not None:
-                if state == 0:
-                    matrix['tempMin'][i] = matrix['tempMinMax'][i]
-                    state = 1
-                else:
-                    matrix['tempMax'][i] = matrix['tempMinMax'][i]
-                    state = 0
-        del matrix['tempMinMax']
-    if 'tempMaxMin' in matrix:
-        state = 1
-        for i in range(nidx):
-            if matrix['tempMaxMin'][i] is not None:
-                if state == 0:
-                    matrix['tempMin'][i] = matrix['tempMaxMin'][i]
-                    state = 1
-                else:
-                    matrix['tempMax'][i] = matrix['tempMaxMin'][i]
-                    state = 0
-        del matrix['tempMaxMin']
+    # the values in a min/max row alternate, so split the non-empty entries
+    # by position: every other one is a min, the rest are maxes.
+    for label, first in (('tempMinMax', 0), ('tempMaxMin', 1)):
+        values = matrix.pop(label, None)
+        if values is not None:
+            pos = [i for i, v in enumerate(values) if v is not None]
+            for i in pos[first::2]:
+                matrix['tempMin'][i] = values[i]
+            for i in pos[1 - first::2]:
+                matrix['tempMax'][i] = values[i]
+
+NWS_MONTHS = MappingProxyType({
+    'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12})
 
 def date2ts(tstr):
     """Convert NWS date string to timestamp in seconds.
     sample format: 418 PM EDT SAT MAY 11 2013
     """
 
+    # do the arithmetic directly rather than use strptime, which is slow and
+    # reads 100 PM as 10:0 PM since %I is greedy.
     parts = tstr.split(' ')
-    s = '%s %s %s %s %s' % (parts[0], parts[1], parts[4], parts[5], parts[6])
-    ts = time.mktime(time.strptime(s, "%I%M %p %b %d %Y"))
-    return int(ts)
+    hm = int(parts[0])
+    hour = hm // 100 % 12
+    if parts[1].upper() == 'PM':
+        hour += 12
+    tt = (int(parts[6]), NWS_MONTHS[parts[4].upper()], int(parts[5]),
+          hour, hm % 100, 0, 0, 0, -1)
+    return int(time.mktime(tt))
 
 def NWSProcessForecast(foid, lid, matrix):
     """convert NWS matrix to records"""
     now = int(time.time())
     records = []
     if matrix is not None:
+        # the fields common to every record
+        base = {'method': NWS_KEY,
+                'usUnits': weewx.US,
+                'dateTime': now,
+                'issued_ts': matrix['issued_ts'],
+                'event_ts': None,
+                'location': '%s %s' % (foid, lid)}
+        # find the per-period columns once, not once per period
+        labels = [label for label in matrix
+                  if isinstance(matrix[label], list)]
+        columns = [matrix[label] for label in labels]
         for i, ts in enumerate(matrix['ts']):
-            record = {}
-            record['method'] = NWS_KEY
-            record['usUnits'] = weewx.US
-            record['dateTime'] = now
-            record['issued_ts'] = matrix['issued_ts']
+            record = dict(base)
             record['event_ts'] = ts
-            record['location'] = '%s %s' % (foid, lid)
-            for label in matrix:
-                if isinstance(matrix[label], list):
-                    record[label] = matrix[label][i]
+            record.update(zip(labels, [c[i] for c in columns]))
             records.append(record)
     return records
 
@@ -2123,15 +2677,21 @@ class DSForecast(Forecast):
                (DS_KEY, self.interval, self.max_age,
                 self.obfuscate(self.api_key), self.location,
                 self.forecast_type))
+        # none of the parts of the url change, so build it only once
+        self.full_url = DSForecast.build_url(
+            self.api_key, self.location, url=self.url,
+            fc_type=self.forecast_type, extend=self.extend,
+            language=self.language)
         self._bind()
 
     def get_forecast(self, dummy_event):
         """Return a parsed forecast."""
 
         text = self.download(api_key=self.api_key, location=self.location,
-                             url=self.url, fc_type=self.forecast_type,
+                             url=self.full_url, fc_type=self.forecast_type,
                              extend=self.extend, language=self.language,
-                             compression=self.use_compression)
+                             compression=self.use_compression,
+                             max_tries=self.max_tries, cache=self.cache)
         if text is None:
             logerr('%s: no forecast data for %s from %s' %
                    (DS_KEY, self.location, self.url))
@@ -2145,10 +2705,27 @@ class DSForecast(Forecast):
         loginf('%s: got %d forecast records' % (DS_KEY, len(records)))
         return records
 
+    @staticmethod
+    def build_url(api_key, location, url=DS_DEFAULT_URL, fc_type='daily',
+                  extend=False, language='en', units='us'):
+        if url != DS_DEFAULT_URL:
+            return url
+        # construct the basic URL for the API call
+        u = '/'.join([url, api_key, location])
+        # build the optional parameters string, first get the exclude string
+        exclude = ','.join([x for x in DS_BLOCKS if x != fc_type])
+        # now build the optional string
+        optional_str = DSForecast._build_optional(exclude=exclude,
+                                                  extend=extend,
+                                                  language=language,
+                                                  units=units)
+        # construct the final URL including optional parameters
+        return '?'.join([u, optional_str]) if len(optional_str) > 0 else u
+
     @staticmethod
     def download(api_key, location, url=DS_DEFAULT_URL, fc_type='daily',
                  extend=False, language='en', compression=True, units='us',
-                 max_tries=3):
+                 max_tries=3, cache=None):
         """Download a forecast from the Dark Sky
 
         api_key - key for downloading
@@ -2177,43 +2754,18 @@ class DSForecast(Forecast):
                 units codes but this method requires 'us'.
 
         max_tries - how many times to try before giving up
+
+        cache - optional ForecastCache from which to get a recent copy
         """
 
-        if url == DS_DEFAULT_URL:
-            # construct the basic URL for the API call
-            u = '/'.join([url, api_key, location])
-            # build the optional parameters string, first get the exclude string
-            exclude = ','.join([x for x in DS_BLOCKS if x != fc_type])
-            # now build the optional string
-            optional_str = DSForecast._build_optional(exclude=exclude,
-                                                      extend=extend,
-                                                      language=language,
-                                                      units=units)
-            # construct the final URL including optional parameters
-            u = '?'.join([u, optional_str]) if len(optional_str) > 0 else u
-        else:
-            u = url
-        request = Request(u)
-        if compression:
-            request.add_header('Accept-Encoding', 'gzip')
+        u = DSForecast.build_url(api_key, location, url=url, fc_type=fc_type,
+                                 extend=extend, language=language, units=units)
+        # every download asks for gzip unless told otherwise
+        headers = None if compression else {'Accept-Encoding': 'identity'}
         masked = Forecast.get_masked_url(u, api_key)
         loginf("%s: downloading forecast from '%s'" % (DS_KEY, masked))
-        for count in range(max_tries):
-            try:
-                response = urlopen(request)
-                if response.info().get('Content-Encoding') == 'gzip':
-                    buf = StringIO(response.read())
-                    f = gzip.GzipFile(fileobj=buf)
-                    text = f.read()
-                else:
-                    text = response.read()
-                return text
-            except (socket.error, URLError, BadStatusLine, IncompleteRead) as e:
-                logerr('%s: failed attempt %d to download forecast: %s' %
-                       (DS_KEY, count + 1, e))
-        else:
-            logerr('%s: failed to download forecast' % DS_KEY)
-        return None
+        return download_url(u, DS_KEY, max_tries=max_tries, headers=headers,
+                            cache=cache)
 
     @staticmethod
     def _build_optional(exclude=None, extend=False, language='en', units='auto'):
@@ -2243,7 +2795,7 @@ class DSForecast(Forecast):
     def parse(text, issued_ts=None, now=None, fc_type='daily', location=None):
         """Parse a raw forecast."""
 
-        obj = json.loads(text)
+        obj = parse_json(text)
         if fc_type not in obj:
             msg = "%s: no '%s' forecast in json object" % (DS_KEY, fc_type)
             logerr(msg)
@@ -2275,144 +2827,106 @@ class DSForecast(Forecast):
             msgs.append(msg)
         return records, msgs
 
+    # the values in each period, as (field, label, kind) tuples.  kind is one
+    # of float, int, pct (a fraction), cm (snowfall in cm) or dir (a bearing
+    # in degrees).  a value that is missing from a period is left out of the
+    # record for that period.
+    DAILY_FIELDS = (
+        ('tempMin', 'temperatureLow', 'float'),
+        ('tempMax', 'temperatureHigh', 'float'),
+        ('temp', 'temperature', 'float'),
+        ('dewpoint', 'dewPoint', 'float'),
+        ('humidity', 'humidity', 'pct'),
+        ('pop', 'precipProbability', 'pct'),
+        ('qsf', 'precipAccumulation', 'cm'),
+        ('windSpeed', 'windSpeed', 'float'),
+        ('windDir', 'windBearing', 'dir'),
+        ('windGust', 'windGust', 'float'),
+        ('uvIndex', 'uvIndex', 'int'))
+
+    HOURLY_FIELDS = (
+        ('temp', 'temperature', 'float'),
+        ('dewpoint', 'dewPoint', 'float'),
+        ('humidity', 'humidity', 'pct'),
+        ('windSpeed', 'windSpeed', 'float'),
+        ('windDir', 'windBearing', 'dir'),
+        ('windGust', 'windGust', 'float'),
+        ('pop', 'precipProbability', 'pct'),
+        ('qsf', 'precipAccumulation', 'cm'),
+        ('uvIndex', 'uvIndex', 'int'))
+
     @staticmethod
     def create_records_from_daily(fc, issued_ts, now, location=None):
         """create from daily forecast data"""
-
-        msgs = []
-        records = []
-        cnt = 0
-        for period in fc['data']:
-            try:
-                cnt += 1
-                r = {}
-                r['method'] = DS_KEY
-                r['usUnits'] = weewx.US
-                r['dateTime'] = now
-                r['issued_ts'] = issued_ts
-                r['event_ts'] = Forecast.str2int('epoch',
-                                                 period['time'],
-                                                 DS_KEY)
-                _dt = datetime.datetime.fromtimestamp(int(period['time']))
-                r['hour'] = _dt.hour
-                r['duration'] = 24 * 3600
-                r['clouds'] = Forecast.pct2clouds(100 * float(period['cloudCover']))
-                r['tempMin'] = Forecast.str2float('temperatureLow',
-                                                  period['temperatureLow'],
-                                                  DS_KEY)
-                r['tempMax'] = Forecast.str2float('temperatureHigh',
-                                                  period['temperatureHigh'],
-                                                  DS_KEY)
-                # It appears that dark sky does not include `temperature` in
-                # daily forecasts. Use 'temperature' if available otherwise
-                # fallback to the average of the high/low.
-                if 'temperature' in period:
-                    r['temp'] = Forecast.str2float('temperature',
-                                                   period['temperature'],
-                                                   DS_KEY)
-                else:
-                    r['temp'] = (r['tempMin'] + r['tempMax']) / 2
-                r['dewpoint'] = Forecast.str2float('dewPoint',
-                                                   period['dewPoint'],
-                                                   DS_KEY)
-                _humidity = Forecast.str2float('humidity',
-                                               period['humidity'],
-                                               DS_KEY)
-                r['humidity'] = int(_humidity * 100) if _humidity is not None else None
-                _pop = Forecast.str2float('precipProbability',
-                                          period['precipProbability'],
-                                          DS_KEY)
-                r['pop'] = int(_pop * 100) if _pop is not None else None
-                # Dark Sky provides snowfall in cm in optional precipAccumulation field
-                if 'precipAccumulation' in period:
-                    _qsf = Forecast.str2float('precipAccumulation',
-                                              period['precipAccumulation'],
-                                              DS_KEY)
-                    r['qsf'] = _qsf / 2.54 if _qsf is not None else None
-                r['windSpeed'] = Forecast.str2float('windSpeed',
-                                                    period['windSpeed'],
-                                                    DS_KEY)
-                if 'windBearing' in period:
-                    r['windDir'] = Forecast.deg2dir(period['windBearing'])
-                r['windGust'] = Forecast.str2float('windGust',
-                                                   period['windGust'],
-                                                   DS_KEY)
-                if 'uvIndex' in period:
-                    r['uvIndex'] = Forecast.str2int('uvIndex',
-                                                    period['uvIndex'],
-                                                    DS_KEY)
-                if location is not None:
-                    r['location'] = location
-                records.append(r)
-            except KeyError as e:
-                msg = '%s: failure in daily forecast period %d: %s' % (
-                    DS_KEY, cnt, e)
-                msgs.append(msg)
-                logerr(msg)
-        return records, msgs
+        return DSForecast.create_records(fc, issued_ts, now, 'daily',
+                                         24 * 3600, DSForecast.DAILY_FIELDS,
+                                         location=location)
 
     @staticmethod
     def create_records_from_hourly(fc, issued_ts, now, location=None):
         """create from hourly forecast"""
+        return DSForecast.create_records(fc, issued_ts, now, 'hourly',
+                                         3600, DSForecast.HOURLY_FIELDS,
+                                         location=location)
+
+    @staticmethod
+    def create_records(fc, issued_ts, now, fc_type, duration, fields,
+                       location=None):
+        """create a record for each period using the indicated fields"""
 
         msgs = []
         records = []
         cnt = 0
+        str2float = Forecast.str2float
+        str2int = Forecast.str2int
         for period in fc['data']:
-            try:
-                cnt += 1
-                r = {}
-                r['method'] = DS_KEY
-                r['usUnits'] = weewx.US
-                r['dateTime'] = now
-                r['issued_ts'] = issued_ts
-                r['event_ts'] = Forecast.str2int('epoch',
-                                                 period['time'],
-                                                 DS_KEY)
-                _dt = datetime.datetime.fromtimestamp(int(period['time']))
-                r['hour'] = _dt.hour
-                r['duration'] = 3600
-                r['clouds'] = Forecast.pct2clouds(100 * float(period['cloudCover']))
-                r['temp'] = Forecast.str2float('temperature',
-                                               period['temperature'],
-                                               DS_KEY)
-                r['dewpoint'] = Forecast.str2float('dewPoint',
-                                                   period['dewPoint'],
-                                                   DS_KEY)
-                _humidity = Forecast.str2float('humidity',
-                                               period['humidity'],
-                                               DS_KEY)
-                r['humidity'] = int(_humidity * 100) if _humidity is not None else None
-                r['windSpeed'] = Forecast.str2float('windSpeed',
-                                                    period['windSpeed'],
-                                                    DS_KEY)
-                if 'windBearing' in period:
-                    r['windDir'] = Forecast.deg2dir(period['windBearing'])
-                r['windGust'] = Forecast.str2float('windGust',
-                                                   period['windGust'],
-                                                   DS_KEY)
-                _pop = Forecast.str2float('precipProbability',
-                                          period['precipProbability'],
-                                          DS_KEY)
-                r['pop'] = int(_pop * 100) if _pop is not None else None
-                # Dark Sky provides snowfall in cm in optional precipAccumulation field
-                if 'precipAccumulation' in period:
-                    _qsf = Forecast.str2float('precipAccumulation',
-                                              period['precipAccumulation'],
-                                              DS_KEY)
-                    r['qsf'] = _qsf / 2.54 if _qsf is not None else None
-                if 'uvIndex' in period:
-                    r['uvIndex'] = Forecast.str2int('uvIndex',
-                                                    period['uvIndex'],
-                                                    DS_KEY)
-                if location is not None:
-                    r['location'] = location
-                records.append(r)
-            except KeyError as e:
-                msg = '%s: failure in hourly forecast period %d: %s' % (
-                    DS_KEY, cnt, e)
+            cnt += 1
+            # the time is the only value that a period must have
+            ts = str2int('time', period.get('time'), DS_KEY)
+            if ts is None:
+                msg = '%s: no time in %s forecast period %d' % (
+                    DS_KEY, fc_type, cnt)
                 msgs.append(msg)
                 logerr(msg)
+                continue
+            r = {}
+            r['method'] = DS_KEY
+            r['usUnits'] = weewx.US
+            r['dateTime'] = now
+            r['issued_ts'] = issued_ts
+            r['event_ts'] = ts
+            r['hour'] = time.localtime(ts).tm_hour
+            r['duration'] = duration
+            v = str2float('cloudCover', period.get('cloudCover'), DS_KEY)
+            if v is not None:
+                r['clouds'] = Forecast.pct2clouds(100 * v)
+            for field, label, kind in fields:
+                v = period.get(label)
+                if v is None:
+                    continue
+                if kind == 'dir':
+                    r[field] = Forecast.deg2dir(v)
+                elif kind == 'int':
+                    r[field] = str2int(label, v, DS_KEY)
+                else:
+                    # the json values are usually floats already
+                    if type(v) is not float:
+                        v = str2float(label, v, DS_KEY)
+                    if v is not None:
+                        if kind == 'pct':
+                            v = int(v * 100)
+                        elif kind == 'cm':
+                            v /= 2.54
+                    r[field] = v
+            # It appears that dark sky does not include `temperature` in
+            # daily forecasts. Use 'temperature' if available otherwise
+            # fallback to the average of the high/low.
+            if ('temp' not in r and r.get('tempMin') is not None and
+                r.get('tempMax') is not None):
+                r['temp'] = (r['tempMin'] + r['tempMax']) / 2
+            if location is not None:
+                r['location'] = location
+            records.append(r)
         return records, msgs
 
 
@@ -2600,7 +3114,7 @@ class WUForecast(Forecast):
     def get_forecast(self, dummy_event):
         text = self.download(self.api_key, self.location, url=self.url,
                              fc_type=self.forecast_type,
-                             max_tries=self.max_tries)
+                             max_tries=self.max_tries, cache=self.cache)
         if text is None:
             logerr('%s: no forecast data for %s from %s' %
                    (WU_KEY, self.location, self.url))
@@ -2615,7 +3129,7 @@ class WUForecast(Forecast):
 
     @staticmethod
     def download(api_key, location, url=WU_DEFAULT_URL,
-                 fc_type='hourly10day', max_tries=3):
+                 fc_type='hourly10day', max_tries=3, cache=None):
         """Download a forecast from the Weather Underground
 
         api_key - key for downloading
@@ -2630,27 +3144,20 @@ class WUForecast(Forecast):
         fc_type - forecast type, one of hourly10day or forecast10day
 
         max_tries - how many times to try before giving up
+
+        cache - optional ForecastCache from which to get a recent copy
         """
 
         u = '%s/%s/%s/q/%s.json' % (url, api_key, fc_type, location) \
             if url == WU_DEFAULT_URL else url
         masked = Forecast.get_masked_url(u, api_key)
         loginf("%s: download forecast from '%s'" % (WU_KEY, masked))
-        for count in range(max_tries):
-            try:
-                response = urlopen(u)
-                text = response.read()
-                return text
-            except (socket.error, URLError, BadStatusLine, IncompleteRead) as e:
-                logerr('%s: failed attempt %d to download forecast: %s' %
-                       (WU_KEY, count + 1, e))
-        else:
-            logerr('%s: failed to download forecast' % WU_KEY)
-        return None
+        return download_url(u, WU_KEY, max_tries=max_tries,
+                            cache=cache)
 
     @staticmethod
     def parse(text, issued_ts=None, now=None, location=None):
-        obj = json.loads(text)
+        obj = parse_json(text)
         if not 'response' in obj:
             msg = "%s: no 'response' in json object" % WU_KEY
             logerr(msg)
@@ -2684,6 +3191,63 @@ class WUForecast(Forecast):
             msgs.append(msg)
         return records, msgs
 
+    # the values in each period, as (field, label, path, kind) tuples.  the
+    # path is the sequence of keys to the value within the period.  kind is
+    # one of float, int, clouds (a percentage), sky (an icon name), dir (a
+    # direction name) or obvis (which looks at the entire period).  the order
+    # matches the order in which the values have always been read.
+    HOURLY_FIELDS = (
+        ('event_ts', 'epoch', ('FCTTIME', 'epoch'), 'int'),
+        ('hour', 'hour', ('FCTTIME', 'hour'), 'int'),
+        ('clouds', 'sky', ('sky',), 'clouds'),
+        ('temp', 'temp', ('temp', 'english'), 'float'),
+        ('dewpoint', 'dewpoint', ('dewpoint', 'english'), 'float'),
+        ('humidity', 'humidity', ('humidity',), 'int'),
+        ('windSpeed', 'wspd', ('wspd', 'english'), 'float'),
+        ('windDir', 'wdir', ('wdir', 'dir'), 'dir'),
+        ('pop', 'pop', ('pop',), 'int'),
+        ('qpf', 'qpf', ('qpf', 'english'), 'float'),
+        ('qsf', 'snow', ('snow', 'english'), 'float'),
+        ('obvis', 'obvis', (), 'obvis'),
+        ('uvIndex', 'uvi', ('uvi',), 'int'))
+
+    DAILY_FIELDS = (
+        ('event_ts', 'epoch', ('date', 'epoch'), 'int'),
+        ('hour', 'hour', ('date', 'hour'), 'int'),
+        ('clouds', 'skyicon', ('skyicon',), 'sky'),
+        ('tempMin', 'low', ('low', 'fahrenheit'), 'float'),
+        ('tempMax', 'high', ('high', 'fahrenheit'), 'float'),
+        ('humidity', 'humidity', ('avehumidity',), 'int'),
+        ('pop', 'pop', ('pop',), 'int'),
+        ('qpf', 'qpf', ('qpf_allday', 'in'), 'float'),
+        ('qsf', 'qsf', ('snow_allday', 'in'), 'float'),
+        ('windSpeed', 'avewind', ('avewind', 'mph'), 'float'),
+        ('windDir', 'avewind', ('avewind', 'dir'), 'dir'),
+        ('windGust', 'maxwind', ('maxwind', 'mph'), 'float'))
+
+    @staticmethod
+    def get_values(r, period, fields):
+        """put the indicated fields from a period into a record.  raises
+        KeyError if the period is missing any of them."""
+        str2float = Forecast.str2float
+        str2int = Forecast.str2int
+        for field, label, path, kind in fields:
+            v = period
+            for k in path:
+                v = v[k]
+            if kind == 'float':
+                r[field] = str2float(label, v, WU_KEY)
+            elif kind == 'int':
+                r[field] = str2int(label, v, WU_KEY)
+            elif kind == 'dir':
+                r[field] = WUForecast.WU_DIR_DICT.get(v, v)
+            elif kind == 'clouds':
+                r[field] = Forecast.pct2clouds(v)
+            elif kind == 'sky':
+                r[field] = WUForecast.WU_SKY_DICT.get(v)
+            elif kind == 'obvis':
+                r[field] = WUForecast.wu2obvis(v)
+
     @staticmethod
     def create_records_from_hourly(fc, issued_ts, now, location=None):
         """create from hourly10day"""
@@ -2698,30 +3262,8 @@ class WUForecast(Forecast):
                 r['usUnits'] = weewx.US
                 r['dateTime'] = now
                 r['issued_ts'] = issued_ts
-                r['event_ts'] = Forecast.str2int(
-                    'epoch', period['FCTTIME']['epoch'], WU_KEY)
-                r['hour'] = Forecast.str2int(
-                    'hour', period['FCTTIME']['hour'], WU_KEY)
                 r['duration'] = 3600
-                r['clouds'] = Forecast.pct2clouds(period['sky'])
-                r['temp'] = Forecast.str2float(
-                    'temp', period['temp']['english'], WU_KEY)
-                r['dewpoint'] = Forecast.str2float(
-                    'dewpoint', period['dewpoint']['english'], WU_KEY)
-                r['humidity'] = Forecast.str2int(
-                    'humidity', period['humidity'], WU_KEY)
-                r['windSpeed'] = Forecast.str2float(
-                    'wspd', period['wspd']['english'], WU_KEY)
-                r['windDir'] = WUForecast.WU_DIR_DICT.get(
-                    period['wdir']['dir'], period['wdir']['dir'])
-                r['pop'] = Forecast.str2int(
-                    'pop', period['pop'], WU_KEY)
-                r['qpf'] = Forecast.str2float(
-                    'qpf', period['qpf']['english'], WU_KEY)
-                r['qsf'] = Forecast.str2float(
-                    'snow', period['snow']['english'], WU_KEY)
-                r['obvis'] = WUForecast.wu2obvis(period)
-                r['uvIndex'] = Forecast.str2int('uvi', period['uvi'], WU_KEY)
+                WUForecast.get_values(r, period, WUForecast.HOURLY_FIELDS)
                 r.update(WUForecast.wu2precip(period))
                 if location is not None:
                     r['location'] = location
@@ -2747,30 +3289,9 @@ class WUForecast(Forecast):
                 r['usUnits'] = weewx.US
                 r['dateTime'] = now
                 r['issued_ts'] = issued_ts
-                r['event_ts'] = Forecast.str2int(
-                    'epoch', period['date']['epoch'], WU_KEY)
-                r['hour'] = Forecast.str2int(
-                    'hour', period['date']['hour'], WU_KEY)
                 r['duration'] = 24 * 3600
-                r['clouds'] = WUForecast.WU_SKY_DICT.get(period['skyicon'])
-                r['tempMin'] = Forecast.str2float(
-                    'low', period['low']['fahrenheit'], WU_KEY)
-                r['tempMax'] = Forecast.str2float(
-                    'high', period['high']['fahrenheit'], WU_KEY)
+                WUForecast.get_values(r, period, WUForecast.DAILY_FIELDS)
                 r['temp'] = (r['tempMin'] + r['tempMax']) / 2
-                r['humidity'] = Forecast.str2int(
-                    'humidity', period['avehumidity'], WU_KEY)
-                r['pop'] = Forecast.str2int('pop', period['pop'], WU_KEY)
-                r['qpf'] = Forecast.str2float(
-                    'qpf', period['qpf_allday']['in'], WU_KEY)
-                r['qsf'] = Forecast.str2float(
-                    'qsf', period['snow_allday']['in'], WU_KEY)
-                r['windSpeed'] = Forecast.str2float(
-                    'avewind', period['avewind']['mph'], WU_KEY)
-                r['windDir'] = WUForecast.WU_DIR_DICT.get(
-                    period['avewind']['dir'], period['avewind']['dir'])
-                r['windGust'] = Forecast.str2float(
-                    'maxwind', period['maxwind']['mph'], WU_KEY)
                 if location is not None:
                     r['location'] = location
                 records.append(r)
@@ -2781,22 +3302,22 @@ class WUForecast(Forecast):
                 logerr(msg)
         return records, msgs
 
-    WU_DIR_DICT = {
+    WU_DIR_DICT = MappingProxyType({
         'North': 'N',
         'South': 'S',
         'East': 'E',
-        'West': 'W'}
+        'West': 'W'})
 
-    WU_SKY_DICT = {
+    WU_SKY_DICT = MappingProxyType({
         'sunny': 'CL',
         'mostlysunny': 'FW',
         'partlysunny': 'SC',
         'FIXME': 'BK', # FIXME: NWS defines BK, but WU has nothing equivalent
         'partlycloudy': 'B1',
         'mostlycloudy': 'B2',
-        'cloudy': 'OV'}
+        'cloudy': 'OV'})
 
-    str2precip_dict = {
+    str2precip_dict = MappingProxyType({
         # nws precip strings
         'Rain': 'rain',
         'Rain Showers': 'rainshwrs',
@@ -2819,9 +3340,9 @@ class WUForecast(Forecast):
         'Hail Showers': 'hail',
         'Small Hail': 'hail',
         'Small Hail Showers': 'hail',
-    }
+    })
 
-    str2obvis_dict = {
+    str2obvis_dict = MappingProxyType({
         # nws obvis strings
         'Fog': 'F',
         'Patchy Fog': 'PF',
@@ -2852,10 +3373,10 @@ class WUForecast(Forecast):
         'Partial Fog': 'PF',
         'Blizzard': 'BS',
         'Rain Mist': 'M',
-    }
+    })
 
     # mapping from string to probability code
-    wx2chance_dict = {
+    wx2chance_dict = MappingProxyType({
         'Slight Chance': 'S',
         'Chance': 'C',
         'Likely': 'L',
@@ -2865,10 +3386,22 @@ class WUForecast(Forecast):
         'Scattered': 'SC',
         'Numerous': 'NM',
         'Extensive': 'EC',
-    }
+    })
+
+    # a wx string is an optional chance followed by a precipitation type at
+    # the end of the string.  the lazy match in the middle finds the longest
+    # precipitation suffix, so 'Freezing Rain' is not mistaken for 'Rain'.
+    _PRECIP_RE = re.compile(
+        r'(?P<chance>' + '|'.join(re.escape(k) for k in sorted(
+            wx2chance_dict, key=len, reverse=True)) + r')?.*?' +
+        r'(?P<precip>' + '|'.join(re.escape(k) for k in sorted(
+            str2precip_dict, key=len, reverse=True)) + r')\Z')
+
+    # a condition such as 'Rain and Snow' or 'Rain with Thunderstorms'
+    _CONDITION_SPLIT = re.compile(r' (?:and|with) ')
 
     # mapping from wu fctcode to a precipitation,chance tuple
-    fct2precip_dict = {
+    fct2precip_dict = MappingProxyType({
         '10': ('rainshwrs', 'C'),
         '11': ('rainshwrs', 'L'),
         '12': ('rain', 'C'),
@@ -2883,17 +3416,18 @@ class WUForecast(Forecast):
         '22': ('sleet', 'C'),
         '23': ('sleet', 'L'),
         '24': ('snowshwrs', 'L'),
-    }
+    })
 
     # mapping from wu fctcode to obvis code
-    fct2obvis_dict = {
+    fct2obvis_dict = MappingProxyType({
         '5': 'H',
         '6': 'F',
         '9': 'BS',
         '24': 'BS',
-    }
+    })
 
     @staticmethod
+    @lru_cache(maxsize=512)
     def str2pc(s):
         """parse a wu wx string for the precipitation type and likeliehood
 
@@ -2901,13 +3435,11 @@ class WUForecast(Forecast):
         Chance of Light Rain Showers     -> rainshwrs,C
         Isolated Thunderstorms           -> tstms,IS
         """
-        for x in WUForecast.str2precip_dict:
-            if s.endswith(x):
-                for y in WUForecast.wx2chance_dict:
-                    if s.startswith(y):
-                        return WUForecast.str2precip_dict[x], WUForecast.wx2chance_dict[y]
-                return WUForecast.str2precip_dict[x], ''
-        return None, 0
+        m = WUForecast._PRECIP_RE.match(s)
+        if m is None:
+            return None, 0
+        return (WUForecast.str2precip_dict[m.group('precip')],
+                WUForecast.wx2chance_dict.get(m.group('chance'), ''))
 
     @staticmethod
     def wu2precip(period):
@@ -2917,19 +3449,9 @@ class WUForecast(Forecast):
         precipitation."""
 
         p = {}
-        # first try the condition field
-        if period['condition'].find(' and ') >= 0:
-            for w in period['condition'].split(' and '):
-                precip, chance = WUForecast.str2pc(w.strip())
-                if precip is not None:
-                    p[precip] = chance
-        elif period['condition'].find(' with ') >= 0:
-            for w in period['condition'].split(' with '):
-                precip, chance = WUForecast.str2pc(w.strip())
-                if precip is not None:
-                    p[precip] = chance
-        else:
-            precip, chance = WUForecast.str2pc(period['condition'])
+        # first try the condition field, which may combine several types
+        for w in WUForecast._CONDITION_SPLIT.split(period['condition']):
+            precip, chance = WUForecast.str2pc(w.strip())
             if precip is not None:
                 p[precip] = chance
         # then augment or possibly override with precip info from the fctcode
@@ -2937,8 +3459,9 @@ class WUForecast(Forecast):
             precip, chance = WUForecast.fct2precip_dict[period['fctcode']]
             p[precip] = chance
         # wx has us nws forecast strings, so trust it the most
-        if len(period['wx']) > 0:
-            for w in period['wx'].split(','):
+        wx = period['wx']
+        if wx:
+            for w in wx.split(','):
                 precip, chance = WUForecast.str2pc(w.strip())
                 if precip is not None:
                     p[precip] = chance
@@ -2948,10 +3471,12 @@ class WUForecast(Forecast):
     def wu2obvis(period):
         """return a single obvis type.  look in wx, fctcode, then condition."""
 
-        if len(period['wx']) > 0:
-            for x in [w.strip() for w in period['wx'].split(',')]:
-                if x in WUForecast.str2obvis_dict:
-                    return WUForecast.str2obvis_dict[x]
+        wx = period['wx']
+        if wx:
+            for w in wx.split(','):
+                x = WUForecast.str2obvis_dict.get(w.strip())
+                if x is not None:
+                    return x
         if period['fctcode'] in WUForecast.fct2obvis_dict:
             return WUForecast.fct2obvis_dict[period['fctcode']]
         if period['condition'] in WUForecast.str2obvis_dict:
@@ -3044,7 +3569,7 @@ class OWMForecast(Forecast):
     def get_forecast(self, dummy_event):
         text = self.download(self.api_key, self.location,
                              url=self.url, fc_type=self.forecast_type,
-                             max_tries=self.max_tries)
+                             max_tries=self.max_tries, cache=self.cache)
         if text is None:
             logerr('%s: no forecast data for %s from %s' %
                    (self.method_id, self.location, self.url))
@@ -3059,7 +3584,7 @@ class OWMForecast(Forecast):
 
     @staticmethod
     def download(api_key, location, url=DEFAULT_URL,
-                 fc_type='5day3hour', max_tries=3):
+                 fc_type='5day3hour', max_tries=3, cache=None):
         """Download a forecast from Open WeatherMap
 
         api_key - key for downloading from OwM
@@ -3074,6 +3599,8 @@ class OWMForecast(Forecast):
         fc_type - forecast type, one of 5day3hour or 16day
 
         max_tries - how many times to try before giving up
+
+        cache - optional ForecastCache from which to get a recent copy
         """
 
         locstr = OWMForecast.get_location_string(location)
@@ -3081,17 +3608,8 @@ class OWMForecast(Forecast):
             if url == OWMForecast.DEFAULT_URL else url
         masked = Forecast.get_masked_url(u, api_key)
         loginf("%s: download forecast from '%s'" % (OWMForecast.KEY, masked))
-
-        for count in range(max_tries):
-            try:
-                response = urlopen(u)
-                return response.read()
-            except (socket.error, URLError, BadStatusLine, IncompleteRead) as e:
-                logerr('%s: failed attempt %d to download forecast: %s' %
-                       (OWMForecast.KEY, count + 1, e))
-        else:
-            logerr('%s: failed to download forecast' % OWMForecast.KEY)
-        return None
+        return download_url(u, OWMForecast.KEY, max_tries=max_tries,
+                            cache=cache)
 
     @staticmethod
     def parse(text, issued_ts=None, now=None, location=None):
@@ -3104,8 +3622,10 @@ class OWMForecast(Forecast):
         msgs = []
         records = []
         cnt = 0
-        fc = json.loads(text)
+        fc = parse_json(text)
         total = fc.get('cnt', 0)
+        str2float = Forecast.str2float
+        str2int = Forecast.str2int
         for period in fc['list']:
             try:
                 cnt += 1
@@ -3114,30 +3634,33 @@ class OWMForecast(Forecast):
                 r['usUnits'] = weewx.US
                 r['dateTime'] = now
                 r['issued_ts'] = issued_ts
-                r['event_ts'] = Forecast.str2int(
+                r['event_ts'] = str2int(
                     'dt', period['dt'], OWMForecast.KEY)
                 r['duration'] = 3 * 3600
-                if 'clouds' in period and 'all' in period['clouds']:
-                    r['clouds'] = Forecast.pct2clouds(period['clouds']['all'])
-                r['temp'] = Forecast.str2float(
-                    'temp', period['main']['temp'],
+                clouds = period.get('clouds')
+                if clouds is not None and 'all' in clouds:
+                    r['clouds'] = Forecast.pct2clouds(clouds['all'])
+                main = period['main']
+                r['temp'] = str2float(
+                    'temp', main['temp'],
                     OWMForecast.KEY) * 9.0 / 5.0 - 459.67
-                r['humidity'] = Forecast.str2int(
-                    'humidity', period['main']['humidity'], OWMForecast.KEY)
-                r['windSpeed'] = Forecast.str2float(
-                    'wind.speed', period['wind']['speed'],
+                r['humidity'] = str2int(
+                    'humidity', main['humidity'], OWMForecast.KEY)
+                wind = period['wind']
+                r['windSpeed'] = str2float(
+                    'wind.speed', wind['speed'],
                     OWMForecast.KEY) * 2.236936
-                r['windDir'] = Forecast.deg2dir(period['wind']['deg'])
-                if 'rain' in period and '3h' in period['rain']:
-                    r['qpf'] = Forecast.str2float(
-                        'rain.3h', period['rain']['3h'],
-                        OWMForecast.KEY) / 25.4
-                if 'snow' in period and '3h' in period['snow']:
-                    r['qsf'] = Forecast.str2float(
-                        'snow.3h', period['snow']['3h'],
-                        OWMForecast.KEY) / 25.4
-                if 'main' in period and 'description' in period['main']:
-                    r['desc'] = period['main']['description']
+                r['windDir'] = Forecast.deg2dir(wind['deg'])
+                rain = period.get('rain')
+                if rain is not None and '3h' in rain:
+                    r['qpf'] = str2float(
+                        'rain.3h', rain['3h'], OWMForecast.KEY) / 25.4
+                snow = period.get('snow')
+                if snow is not None and '3h' in snow:
+                    r['qsf'] = str2float(
+                        'snow.3h', snow['3h'], OWMForecast.KEY) / 25.4
+                if 'description' in main:
+                    r['desc'] = main['description']
                 if location is not None:
                     r['location'] = location
                 # FIXME pressure
@@ -3263,7 +3786,8 @@ class UKMOForecast(Forecast):
 
     def get_forecast(self, dummy_event):
         text = self.download(self.api_key, self.location,
-                             url=self.url, max_tries=self.max_tries)
+                             url=self.url, max_tries=self.max_tries,
+                             cache=self.cache)
         if text is None:
             logerr('%s: no forecast data for %s from %s' %
                    (self.method_id, self.location, self.url))
@@ -3277,7 +3801,8 @@ class UKMOForecast(Forecast):
         return records
 
     @staticmethod
-    def download(api_key, location, url=DEFAULT_URL, max_tries=3):
+    def download(api_key, location, url=DEFAULT_URL, max_tries=3,
+                 cache=None):
         """Download a forecast from UK Met Office
 
         api_key - key for downloading
@@ -3290,23 +3815,16 @@ class UKMOForecast(Forecast):
               to it.
 
         max_tries - how many times to try before giving up
+
+        cache - optional ForecastCache from which to get a recent copy
         """
 
         u = '%s%s?res=3hourly&key=%s' % (url, location, api_key) \
             if url == UKMOForecast.DEFAULT_URL else url
         masked = Forecast.get_masked_url(u, api_key)
         loginf("%s: download forecast from '%s'" % (UKMOForecast.KEY, masked))
-
-        for count in range(max_tries):
-            try:
-                response = urlopen(u)
-                return response.read()
-            except (socket.error, URLError, BadStatusLine, IncompleteRead) as e:
-                logerr('%s: failed attempt %d to download forecast: %s' %
-                       (UKMOForecast.KEY, count + 1, e))
-        else:
-            logerr('%s: failed to download forecast' % UKMOForecast.KEY)
-        return None
+        return download_url(u, UKMOForecast.KEY, max_tries=max_tries,
+                            cache=cache)
 
     @staticmethod
     def parse(text, now=None, location=None):
@@ -3315,7 +3833,7 @@ class UKMOForecast(Forecast):
         msgs = []
         records = []
         cnt = 0
-        fc = json.loads(text)
+        fc = parse_json(text)
         try:
             fc['SiteRep']['DV']['dataDate']
             fc['SiteRep']['DV']['Location']['Period']
@@ -3327,37 +3845,41 @@ class UKMOForecast(Forecast):
             logerr("%s: missing field %s" % (UKMOForecast.KEY, e))
             return records, msgs
         issued_ts = UKMOForecast.dd2ts(fc['SiteRep']['DV']['dataDate'])
+        # the fields common to every record
+        base = {'method': UKMOForecast.KEY,
+                'usUnits': weewx.US,
+                'dateTime': now,
+                'issued_ts': issued_ts,
+                'event_ts': None,
+                'duration': 3 * 3600}
+        if location is not None:
+            base['location'] = location
+        str2float = Forecast.str2float
+        str2int = Forecast.str2int
         for period in fc['SiteRep']['DV']['Location']['Period']:
             day_ts = UKMOForecast.pv2ts(period['value'])
             for rep in period['Rep']:
                 try:
                     cnt += 1
-                    r = {}
-                    r['method'] = UKMOForecast.KEY
-                    r['usUnits'] = weewx.US
-                    r['dateTime'] = now
-                    r['issued_ts'] = issued_ts
-                    r['event_ts'] = Forecast.str2int(
+                    r = dict(base)
+                    r['event_ts'] = str2int(
                         'offset', rep['$'], UKMOForecast.KEY) * 60 + day_ts
-                    r['duration'] = 3 * 3600
-                    r['temp'] = Forecast.str2float(
+                    r['temp'] = str2float(
                         'temp', rep['T'], UKMOForecast.KEY) * 9.0 / 5.0 + 32
-                    r['humidity'] = Forecast.str2int(
+                    r['humidity'] = str2int(
                         'humidity', rep['H'], UKMOForecast.KEY)
-                    r['windSpeed'] = Forecast.str2float(
+                    r['windSpeed'] = str2float(
                         'windSpeed', rep['S'], UKMOForecast.KEY)
-                    r['windGust'] = Forecast.str2float(
+                    r['windGust'] = str2float(
                         'windGust', rep['G'], UKMOForecast.KEY)
                     r['windDir'] = rep['D']
-                    r['pop'] = Forecast.str2int(
+                    r['pop'] = str2int(
                         'pop', rep['Pp'], UKMOForecast.KEY)
-                    r['uvIndex'] = Forecast.str2int(
+                    r['uvIndex'] = str2int(
                         'uvIndex', rep['U'], UKMOForecast.KEY)
                     # feelslike 'F'
                     # weather type 'W'
                     # visibility 'V'
-                    if location is not None:
-                        r['location'] = location
                     records.append(r)
                 except KeyError as e:
                     msg = '%s: failure in forecast period %d: %s' % (
@@ -3368,16 +3890,11 @@ class UKMOForecast(Forecast):
 
     @staticmethod
     def dd2ts(s):
-        s = s.replace('T', ' ')
-        s = s.replace('Z', '')
-        tt = time.strptime(s, '%Y-%m-%d %H:%M:%S')
-        return int(calendar.timegm(tt))
+        return _parse_epoch('%Y-%m-%dT%H:%M:%SZ', s)
 
     @staticmethod
     def pv2ts(s):
-        s = s.replace('Z', '')
-        tt = time.strptime(s, '%Y-%m-%d')
-        return int(calendar.timegm(tt))
+        return _parse_epoch('%Y-%m-%dZ', s)
 
 
 # -----------------------------------------------------------------------------
@@ -3494,12 +4011,17 @@ class AerisForecast(Forecast):
                (self.method_id, self.interval, self.max_age,
                 self.obfuscate(self.client_id),
                 self.obfuscate(self.client_secret), self.location))
+        # none of the parts of the url change, so build it only once
+        self.full_url = AerisForecast.build_url(
+            self.client_id, self.client_secret, self.location,
+            self.forecast_type, self.url)
         self._bind()
 
     def get_forecast(self, dummy_event):
         text = self.download(self.client_id, self.client_secret, self.location,
                              self.forecast_type,
-                             url=self.url, max_tries=self.max_tries)
+                             url=self.full_url, max_tries=self.max_tries,
+                             cache=self.cache)
         if text is None:
             logerr('%s: no forecast data for %s from %s' %
                    (self.method_id, self.location, self.url))
@@ -3512,13 +4034,13 @@ class AerisForecast(Forecast):
         loginf('%s: got %d forecast records' % (self.method_id, len(records)))
         return records
 
-    _LATLON = re.compile('[\d\+\-]+,[\d\+\-]+')
+    _LATLON = re.compile(r'[+-]?\d+(?:\.\d*)?,[+-]?\d+(?:\.\d*)?\Z', RE_ASCII)
 
     @staticmethod
     def build_url(client_id, client_secret, location, fc_type, url):
         ep = location
         opts = ['client_id=%s' % client_id, 'client_secret=%s' % client_secret]
-        if location and AerisForecast._LATLON.search(location):
+        if location and AerisForecast._LATLON.match(location):
             ep = 'closest'
             opts.append('p=%s' % location)
         opts.append('filter=%s' % fc_type)
@@ -3528,7 +4050,7 @@ class AerisForecast(Forecast):
 
     @staticmethod
     def download(client_id, client_secret, location,
-                 fc_type='1hr', url=DEFAULT_URL, max_tries=3):
+                 fc_type='1hr', url=DEFAULT_URL, max_tries=3, cache=None):
         """Download a forecast from Aeris
 
         client_id, client_secret - credentials for downloading
@@ -3542,6 +4064,8 @@ class AerisForecast(Forecast):
               specified, it is used as the base and other items are added to it.
 
         max_tries - how many times to try before giving up
+
+        cache - optional ForecastCache from which to get a recent copy
         """
 
         u = AerisForecast.build_url(
@@ -3549,24 +4073,15 @@ class AerisForecast(Forecast):
         masked = Forecast.get_masked_url(u, client_id)
         masked = Forecast.get_masked_url(masked, client_secret)
         loginf("%s: download forecast from '%s'" % (AerisForecast.KEY, masked))
-
-        for count in range(max_tries):
-            try:
-                response = urlopen(u)
-                return response.read()
-            except (socket.error, URLError, BadStatusLine, IncompleteRead) as e:
-                logerr('%s: failed attempt %d to download forecast: %s' %
-                       (AerisForecast.KEY, count + 1, e))
-        else:
-            logerr('%s: failed to download forecast' % AerisForecast.KEY)
-        return None
+        return download_url(u, AerisForecast.KEY, max_tries=max_tries,
+                            cache=cache)
 
     @staticmethod
     def parse(text, issued_ts=None, now=None, location=None):
         msgs = []
         records = []
 
-        obj = json.loads(text)
+        obj = parse_json(text)
         if not ('response' in obj and 'success' in obj and 'error' in obj):
             msg = "%s: no response/success/error in reply" % AerisForecast.KEY
             logerr(msg)
@@ -3594,44 +4109,48 @@ class AerisForecast(Forecast):
         response = obj['response'][0]
         istr = response['interval'][0:-2]
         dur = 3600 * int(istr)
-        cnt = 0
-        for p in response['periods']:
+        # the fields common to every record
+        base = {'method': AerisForecast.KEY,
+                'usUnits': weewx.US,
+                'dateTime': now,
+                'issued_ts': issued_ts,
+                'event_ts': None,
+                'duration': dur}
+        if location is not None:
+            base['location'] = location
+        str2float = AerisForecast.str2float
+        str2int = AerisForecast.str2int
+        for cnt, p in enumerate(response['periods'], 1):
             try:
-                cnt += 1
-                r = {}
-                r['method'] = AerisForecast.KEY
-                r['usUnits'] = weewx.US
-                r['dateTime'] = now
-                r['issued_ts'] = issued_ts
-                r['event_ts'] = AerisForecast.str2int(p, 'timestamp')
-                r['duration'] = dur
-                r['tempMax'] = AerisForecast.str2float(p, 'maxTempF')
-                r['tempMin'] = AerisForecast.str2float(p, 'minTempF')
+                r = dict(base)
+                r['event_ts'] = str2int(p, 'timestamp')
+                r['tempMax'] = str2float(p, 'maxTempF')
+                r['tempMin'] = str2float(p, 'minTempF')
                 # avgTempF
-                r['temp'] = AerisForecast.str2float(p, 'tempF')
-                r['pop'] = AerisForecast.str2float(p, 'pop')
-                r['qpf'] = AerisForecast.str2float(p, 'precipIN')
+                r['temp'] = str2float(p, 'tempF')
+                r['pop'] = str2float(p, 'pop')
+                r['qpf'] = str2float(p, 'precipIN')
                 # iceaccum
-                r['humidity'] = AerisForecast.str2int(p, 'humidity')
+                r['humidity'] = str2int(p, 'humidity')
                 # maxHumidity
                 # minHumidity
-                r['uvIndex'] = AerisForecast.str2int(p, 'uvi')
+                r['uvIndex'] = str2int(p, 'uvi')
                 # pressureIN
                 # skye
-                r['qsf'] = AerisForecast.str2float(p, 'snowIN')
+                r['qsf'] = str2float(p, 'snowIN')
                 # feelslikeF
                 # minFeelslikeF
                 # maxFeelslikeF
                 # avgFeelslikeF
-                r['dewpoint'] = AerisForecast.str2float(p, 'dewpointF')
+                r['dewpoint'] = str2float(p, 'dewpointF')
                 # maxDewpointF
                 # minDewpointF
                 # avgDewpointF
                 r['windDir'] = p['windDir']
                 # windDirMax
                 # windDirMin
-                r['windGust'] = AerisForecast.str2float(p, 'windGustMPH')
-                r['windSpeed'] = AerisForecast.str2float(p, 'windSpeedMPH')
+                r['windGust'] = str2float(p, 'windGustMPH')
+                r['windSpeed'] = str2float(p, 'windSpeedMPH')
                 # windSpeedMaxMPH
                 # windSpeedMinMPH
                 # windDir80m
@@ -3654,8 +4173,6 @@ class AerisForecast(Forecast):
                 # sunriseISO
                 # sunset
                 # sunsetISO
-                if location is not None:
-                    r['location'] = location
                 records.append(r)
             except KeyError as e:
                 msg = '%s: failure in forecast period %d: %s' % (
@@ -3761,11 +4278,15 @@ class WWOForecast(Forecast):
         loginf('%s: interval=%s max_age=%s api_key=%s location=%s' %
                (self.method_id, self.interval, self.max_age,
                 self.obfuscate(self.api_key), self.location))
+        # none of the parts of the url change, so build it only once
+        self.full_url = WWOForecast.build_url(
+            self.api_key, self.location, self.forecast_type, self.url)
         self._bind()
 
     def get_forecast(self, dummy_event):
         text = self.download(self.api_key, self.location, self.forecast_type,
-                             url=self.url, max_tries=self.max_tries)
+                             url=self.full_url, max_tries=self.max_tries,
+                             cache=self.cache)
         if text is None:
             logerr('%s: no forecast data for %s from %s' %
                    (self.method_id, self.location, self.url))
@@ -3792,7 +4313,8 @@ class WWOForecast(Forecast):
         return u
 
     @staticmethod
-    def download(api_key, location, fc_type=3, url=DEFAULT_URL, max_tries=3):
+    def download(api_key, location, fc_type=3, url=DEFAULT_URL, max_tries=3,
+                 cache=None):
         """Download a forecast from WWO
 
         api_key - credentials for downloading
@@ -3806,26 +4328,19 @@ class WWOForecast(Forecast):
               specified, it is used as the base and other items are added to it.
 
         max_tries - how many times to try before giving up
+
+        cache - optional ForecastCache from which to get a recent copy
         """
 
         u = WWOForecast.build_url(api_key, location, fc_type, url)
         masked = Forecast.get_masked_url(u, api_key)
         loginf("%s: download forecast from '%s'" % (WWOForecast.KEY, masked))
-
-        for count in range(max_tries):
-            try:
-                response = urlopen(u)
-                return response.read()
-            except (socket.error, URLError, BadStatusLine, IncompleteRead) as e:
-                logerr('%s: failed attempt %d to download forecast: %s' %
-                       (WWOForecast.KEY, count + 1, e))
-        else:
-            logerr('%s: failed to download forecast' % WWOForecast.KEY)
-        return None
+        return download_url(u, WWOForecast.KEY, max_tries=max_tries,
+                            cache=cache)
 
     @staticmethod
     def parse(text, issued_ts=None, now=None, location=None):
-        obj = json.loads(text)
+        obj = parse_json(text)
         if 'results' in obj and 'error' in obj['results']:
             msg = "%s: %s: %s" % (WWOForecast.KEY,
                                   obj['results']['error']['type'],
@@ -3849,21 +4364,25 @@ class WWOForecast(Forecast):
         cnt = 0
         ival = 3 # FIXME
         # FIXME: loc = obj['data']['request']['query']
+        # the fields common to every record
+        base = {'method': WWOForecast.KEY,
+                'usUnits': weewx.US,
+                'dateTime': now,
+                'issued_ts': issued_ts,
+                'event_ts': None,
+                'duration': ival * 3600} # FIXME
+        if location is not None:
+            base['location'] = location
+        str2float = WWOForecast.str2float
+        str2int = WWOForecast.str2int
         for day in obj['data']['weather']:
-            day_tt = time.strptime(day['date'], '%Y-%m-%d')
-            day_ts = int(time.mktime(day_tt))
+            day_ts = int(_parse_local_epoch('%Y-%m-%d', day['date']))
             for p in day['hourly']:
                 try:
                     cnt += 1
-                    local_ts = WWOForecast.str2int(p, 'time') * 36 + day_ts
-                    local_tt = time.localtime(local_ts)
-                    r = {}
-                    r['method'] = WWOForecast.KEY
-                    r['usUnits'] = weewx.US
-                    r['dateTime'] = now
-                    r['issued_ts'] = issued_ts
-                    r['event_ts'] = int(time.mktime(local_tt))
-                    r['duration'] = ival * 3600 # FIXME
+                    local_ts = str2int(p, 'time') * 36 + day_ts
+                    r = dict(base)
+                    r['event_ts'] = local_ts
                     # chanceoffog
                     # chanceoffrost
                     # chanceofovercast
@@ -3874,24 +4393,22 @@ class WWOForecast(Forecast):
                     # chanceofthunder
                     # chanceofwindy
                     r['clouds'] = Forecast.pct2clouds(p['cloudcover'])
-                    r['dewpoint'] = WWOForecast.str2float(p, 'DewPointF')
+                    r['dewpoint'] = str2float(p, 'DewPointF')
                     # feelslike
-                    r['heatIndex'] = WWOForecast.str2float(p, 'HeatIndexF')
-                    r['humidity'] = WWOForecast.str2float(p, 'humidity')
-                    r['qpf'] = WWOForecast.str2float(p, 'precipMM') / 25.4
+                    r['heatIndex'] = str2float(p, 'HeatIndexF')
+                    r['humidity'] = str2float(p, 'humidity')
+                    r['qpf'] = str2float(p, 'precipMM') / 25.4
                     # pressure
-                    r['temp'] = WWOForecast.str2float(p, 'tempF')
+                    r['temp'] = str2float(p, 'tempF')
                     # visibility
                     # weatherCode
                     # weatherDesc
                     # weatherIconUrl
-                    r['windChill'] = WWOForecast.str2float(p, 'WindChillF')
+                    r['windChill'] = str2float(p, 'WindChillF')
                     r['windDir'] = p['winddir16Point']
                     # winddirDegree
-                    r['windGust'] = WWOForecast.str2float(p, 'WindGustMiles')
-                    r['windSpeed'] = WWOForecast.str2float(p, 'windspeedMiles')
-                    if location is not None:
-                        r['location'] = location
+                    r['windGust'] = str2float(p, 'WindGustMiles')
+                    r['windSpeed'] = str2float(p, 'windspeedMiles')
                     records.append(r)
                 except KeyError as e:
                     msg = '%s: failure in forecast period %d: %s' % (
@@ -3923,7 +4440,7 @@ class WWOForecast(Forecast):
 
 XT_KEY = 'XTide'
 XT_PROG = '/usr/bin/tide'
-XT_HILO = {'High Tide': 'H', 'Low Tide': 'L'}
+XT_HILO = MappingProxyType({'High Tide': 'H', 'Low Tide': 'L'})
 
 class XTideForecast(Forecast):
     """generate tide forecast using xtide"""
@@ -3951,10 +4468,10 @@ class XTideForecast(Forecast):
             self.location, dur=self.duration, prog=self.tideprog)
         if lines is None:
             return None
-        records = self.parse(lines, self.location)
+        records = self.parse(lines, location=self.location)
         if records is None:
             return None
-        logdbg('%s: tide matrix: %s' % (self.method_id, records))
+        logdbg('%s: tide matrix: %s', self.method_id, records)
         return records
 
     @staticmethod
@@ -3963,6 +4480,13 @@ class XTideForecast(Forecast):
         if now is None:
             now = int(time.time())
         records = []
+        # the fields common to every record
+        base = {'method': XT_KEY,
+                'usUnits': weewx.US,
+                'dateTime': int(now),
+                'issued_ts': int(now),
+                'event_ts': None,
+                'location': location}
         for line in lines:
             line = line.rstrip()
             if not line:
@@ -3973,8 +4497,7 @@ class XTideForecast(Forecast):
                 continue
             if fields[4] == 'High Tide' or fields[4] == 'Low Tide':
                 s = '%s %s' % (fields[1], fields[2])
-                tt = time.strptime(s, '%Y.%m.%d %H:%M')
-                ts = time.mktime(tt)
+                ts = _parse_local_epoch('%Y.%m.%d %H:%M', s)
                 ofields = fields[3].split(' ')
                 if ofields[1] == 'ft':
                     offset = ofields[0]
@@ -3984,15 +4507,10 @@ class XTideForecast(Forecast):
                 else:
                     logerr("%s: unknown units '%s'" % (XT_KEY, ofields[1]))
                     continue
-                record = {}
-                record['method'] = XT_KEY
-                record['usUnits'] = weewx.US
-                record['dateTime'] = int(now)
-                record['issued_ts'] = int(now)
+                record = dict(base)
                 record['event_ts'] = int(ts)
                 record['hilo'] = XT_HILO[fields[4]]
                 record['offset'] = offset
-                record['location'] = location
                 records.append(record)
         return records
 
@@ -4007,28 +4525,28 @@ class XTideForecast(Forecast):
             ets = sts + dur
         st = time.strftime('%Y-%m-%d %H:%M', time.localtime(sts))
         et = time.strftime('%Y-%m-%d %H:%M', time.localtime(ets))
-        cmd = "%s -fc -df'%%Y.%%m.%%d' -tf'%%H:%%M' -l'%s' -b'%s' -e'%s'" % (
-            prog, location, st, et)
+        cmd = [prog, '-fc', '-df', '%Y.%m.%d', '-tf', '%H:%M',
+               '-l', location, '-b', st, '-e', et]
         try:
             loginf('%s: generating tides from %s to %s' %
                    (XT_KEY,
                     weeutil.weeutil.timestamp_to_string(sts),
                     weeutil.weeutil.timestamp_to_string(ets)))
-            logdbg("%s: running command '%s'" % (XT_KEY, cmd))
-            p = subprocess.Popen(cmd, shell=True,
+            logdbg("%s: running command '%s'", XT_KEY, ' '.join(cmd))
+            # run xtide directly rather than through a shell.  read stdout
+            # and stderr together so that neither pipe can fill and stall
+            # xtide, then look at the exit code once xtide has finished.
+            p = subprocess.Popen(cmd,
+                                 universal_newlines=True,
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.PIPE)
-            rc = p.returncode
-            if rc is not None:
-                logerr("%s: generate forecast failed: loc='%s' code=%s" %
-                       (XT_KEY, location, -rc))
-                return None
+            stdout, stderr = p.communicate()
 
             # look for comma-delimited output.  we expect lines like this:
             #   location,YYYY-MM-DD,HH:MM xM xxx,offset,description
             # xtide replaces commas in the location with |
             out = []
-            for line in p.stdout:
+            for line in stdout.splitlines(True):
                 if line.count(',') == 4:
                     out.append(line)
                 else:
@@ -4047,7 +4565,7 @@ class XTideForecast(Forecast):
             # we got no recognizable output, so try to make sense of any errors
             err = []
             preamble = True
-            for line in p.stderr:
+            for line in stderr.splitlines():
                 if line.startswith('Indexing'):
                     preamble = False
                 if not line.startswith('Indexing') and not preamble:
@@ -4062,6 +4580,9 @@ class XTideForecast(Forecast):
                 errmsg = errmsg[idx:]
             if len(errmsg):
                 logerr('%s: generate forecast failed: %s' % (XT_KEY, errmsg))
+            elif p.returncode:
+                logerr("%s: generate forecast failed: loc='%s' code=%s" %
+                       (XT_KEY, location, p.returncode))
 
             return None
         except OSError as e:
@@ -4226,107 +4747,58 @@ def _create_from_histogram(histogram):
     return x
 
 
-def _get_stats(key, a, b):
-    try:
-        s = a.get(key, None)
+def _to_float(s):
+    """convert a value, or a ValueHelper, to a float in US units"""
+    if type(s) == weewx.units.ValueHelper:
+        return weewx.units.convertStd(s.value_t, weewx.US)[0]
+    return float(s)
+
+def _get_column(key, rows):
+    """return the values of key from the rows as floats in US units.  values
+    that are missing or that cannot be converted are skipped."""
+    col = []
+    for r in rows:
+        s = r.get(key)
         if s is None:
-            return
-        elif type(s) == weewx.units.ValueHelper:
-            x = weewx.units.convertStd(s.value_t, weewx.US)[0]
-        else:
-            x = float(s)
-        if x is None:
-            return
-        if b[key] is None:
-            b[key] = x
-            b[key + 'N'] = 1
-            b[key + 'Min'] = x
-            _m = a.get(key + 'Min')
-            if _m is not None:
-                if type(_m) == weewx.units.ValueHelper:
-                    _min = weewx.units.convertStd(_m.value_t, weewx.US).value
-                else:
-                    _min = float(_m)
-                if _min is not None:
-                    b[key + 'Min'] = min(b[key + 'Min'], _min)
-            b[key + 'Max'] = x
-            _m = a.get(key + 'Max')
-            if _m is not None:
-                if type(_m) == weewx.units.ValueHelper:
-                    _max = weewx.units.convertStd(_m.value_t, weewx.US).value
-                else:
-                    _max = float(_m)
-                b[key + 'Max'] = max(b[key + 'Max'], _max)
-        else:
-            n = b[key + 'N'] + 1
-            b[key] = (b[key] * b[key + 'N'] + x) / n
-            b[key + 'N'] = n
-            if x < b[key + 'Min']:
-                b[key + 'Min'] = x
-            _m = a.get(key + 'Min')
+            continue
+        try:
+            x = _to_float(s)
+        except (ValueError, TypeError) as e:
+            logdbg("_get_column: %s" % e)
+            continue
+        if x is not None:
+            col.append(x)
+    return col
+
+def _get_stats(key, rows, b):
+    """calculate the average, min, and max of key over the rows.  the min
+    and max include the keyMin and keyMax fields of any row whose key has a
+    value."""
+    vals = []
+    lo = []
+    hi = []
+    for r in rows:
+        s = r.get(key)
+        if s is None:
+            continue
+        try:
+            x = _to_float(s)
+            if x is None:
+                continue
+            vals.append(x)
+            _m = r.get(key + 'Min')
             if _m is not None:
-                if type(_m) == weewx.units.ValueHelper:
-                    _min = weewx.units.convertStd(_m.value_t, weewx.US).value
-                else:
-                    _min = float(_m)
-                if _min is not None:
-                    b[key + 'Min'] = min(b[key + 'Min'], _min)
-            if x > b[key + 'Max']:
-                b[key + 'Max'] = x
-            _m = a.get(key + 'Max')
+                lo.append(_to_float(_m))
+            _m = r.get(key + 'Max')
             if _m is not None:
-                if type(_m) == weewx.units.ValueHelper:
-                    _max = weewx.units.convertStd(_m.value_t, weewx.US).value
-                else:
-                    _max = float(_m)
-                b[key + 'Max'] = max(b[key + 'Max'], _max)
-    except (ValueError, TypeError) as e:
-        logdbg("_get_stats: %s" % e)
-
-def _get_sum(key, a, b):
-    y = b.get(key, None)
-    try:
-        s = a.get(key, None)
-        if s is not None:
-            if type(s) == weewx.units.ValueHelper:
-                x = weewx.units.convertStd(s.value_t, weewx.US)[0]
-            else:
-                x = float(s)
-            if y is not None and x is not None:
-                return y + x
-            if x is not None:
-                return x
-    except (ValueError, TypeError) as e:
-        logdbg("_get_sum: %s" % e)
-    return y
-
-def _get_min(key, a, b):
-    try:
-        s = a.get(key, None)
-        if s is not None:
-            if type(s) == weewx.units.ValueHelper:
-                x = weewx.units.convertStd(s.value_t, weewx.US)[0]
-            else:
-                x = float(s)
-            if b.get(key, None) is None or x < b[key]:
-                return x
-    except (ValueError, TypeError) as e:
-        logdbg("_get_min: %s" % e)
-    return b.get(key, None)
-
-def _get_max(key, a, b):
-    try:
-        s = a.get(key, None)
-        if s is not None:
-            if type(s) == weewx.units.ValueHelper:
-                x = weewx.units.convertStd(s.value_t, weewx.US)[0]
-            else:
-                x = float(s)
-            if b.get(key, None) is None or x > b[key]:
-                return x
-    except (ValueError, TypeError) as e:
-        logdbg("_get_max: %s" % e)
-    return b.get(key, None)
+                hi.append(_to_float(_m))
+        except (ValueError, TypeError) as e:
+            logdbg("_get_stats: %s" % e)
+    if vals:
+        b[key] = sum(vals) / len(vals)
+        b[key + 'N'] = len(vals)
+        b[key + 'Min'] = min(vals + [x for x in lo if x is not None])
+        b[key + 'Max'] = max(vals + [x for x in hi if x is not None])
 
 
 class ForecastVariables(SearchList):
@@ -4349,42 +4821,46 @@ class ForecastVariables(SearchList):
         # the 'Forecast' section of skin.conf
         sd = generator.skin_dict.get('Forecast', {})
         label_dict = sd.get('Labels', {})
+        # merge the skin labels with the defaults once, not on every lookup
         self.labels = {}
-        self.labels['Directions'] = dict(
-            list(directions_label_dict.items()) +
-            list(label_dict.get('Directions', {}).items()))
-        self.labels['Tide'] = dict(
-            list(tide_label_dict.items()) +
-            list(label_dict.get('Tide', {}).items()))
-        self.labels['Weather'] = dict(
-            list(weather_label_dict.items()) +
-            list(label_dict.get('Weather', {}).items()))
-        self.labels['Zambretti'] = dict(
-            list(zambretti_label_dict.items()) +
-            list(label_dict.get('Zambretti', {}).items()))
+        for module, defaults in [('Directions', directions_label_dict),
+                                 ('Tide', tide_label_dict),
+                                 ('Weather', weather_label_dict),
+                                 ('Zambretti', zambretti_label_dict)]:
+            labels = dict(defaults)
+            labels.update(label_dict.get(module, {}))
+            self.labels[module] = MappingProxyType(labels)
+        self.labels['NWS'] = self.labels['Weather'] # backward compatibility
 
         self.db_max_tries = 3
         self.db_retry_wait = 5 # seconds
+        self.dbm_dict = None
+
+    def _get_dbm_dict(self):
+        """resolve the forecast bindings on the first query of a report, then
+        reuse them for the rest of the report"""
+        if self.dbm_dict is None:
+            self.dbm_dict = weewx.manager.get_manager_dict(
+                self.generator.config_dict['DataBindings'],
+                self.generator.config_dict['Databases'],
+                self.binding,
+                default_binding_dict=DEFAULT_BINDING_DICT)
+        return self.dbm_dict
 
     def get_extension_list(self, timespan, db_lookup):
         return [{'forecast': self}]
 
     def _getTides(self, context, from_ts=None, max_events=1):
-        dbm_dict = weewx.manager.get_manager_dict(
-            self.generator.config_dict['DataBindings'],
-            self.generator.config_dict['Databases'],
-            self.binding,
-            default_binding_dict=DEFAULT_BINDING_DICT)
-        with weewx.manager.open_manager(dbm_dict) as dbm:
+        with weewx.manager.open_manager(self._get_dbm_dict()) as dbm:
             if from_ts is None:
                 from_ts = int(time.time())
-            sql = "select dateTime,issued_ts,event_ts,hilo,offset,usUnits,location from %s where method = 'XTide' and dateTime = (select max(dateTime) from %s where method = 'XTide') and event_ts >= %d order by event_ts asc" % (dbm.table_name, dbm.table_name, from_ts)
+            sql = "select dateTime,issued_ts,event_ts,hilo,offset,usUnits,location from %s where method = 'XTide' and dateTime = (select max(dateTime) from %s where method = 'XTide') and event_ts >= ? order by event_ts asc" % (dbm.table_name, dbm.table_name)
             if max_events is not None:
                 sql += ' limit %d' % max_events
             for count in range(self.db_max_tries):
                 try:
                     records = []
-                    for rec in dbm.genSql(sql):
+                    for rec in dbm.genSql(sql, (int(from_ts),)):
                         r = {}
                         r['dateTime'] = self._create_value(
                             context, 'dateTime', rec[0], 'group_time')
@@ -4412,20 +4888,16 @@ class ForecastVariables(SearchList):
         indicated period of time, limiting to max_events records"""
         # NB: this query assumes that forecasting is deterministic, i.e., two
         # queries to a single forecast will always return the same results.
-        dbm_dict = weewx.manager.get_manager_dict(
-            self.generator.config_dict['DataBindings'],
-            self.generator.config_dict['Databases'],
-            self.binding,
-            default_binding_dict=DEFAULT_BINDING_DICT)
-        with weewx.manager.open_manager(dbm_dict) as dbm:
-            sql = "select * from %s where method = '%s' and event_ts >= %d and event_ts <= %d and dateTime = (select max(dateTime) from %s where method = '%s') order by event_ts asc" % (dbm.table_name, fid, from_ts, to_ts, dbm.table_name, fid)
+        with weewx.manager.open_manager(self._get_dbm_dict()) as dbm:
+            sql = "select * from %s where method = ? and event_ts >= ? and event_ts <= ? and dateTime = (select max(dateTime) from %s where method = ?) order by event_ts asc" % (dbm.table_name, dbm.table_name)
+            args = (fid, int(from_ts), int(to_ts), fid)
             if max_events is not None:
                 sql += ' limit %d' % max_events
             for count in range(self.db_max_tries):
                 try:
                     records = []
                     columns = dbm.connection.columnsOf(dbm.table_name)
-                    for rec in dbm.genSql(sql):
+                    for rec in dbm.genSql(sql, args):
                         r = {}
                         for i, f in enumerate(columns):
                             r[f] = rec[i]
@@ -4443,19 +4915,25 @@ class ForecastVariables(SearchList):
                       fid='', units=None, unit_system=weewx.US):
         """create a value with units from the specified string"""
         v = None
-        try:
-            if value_str in [None, 'None', '']:
-                pass
-            elif value_str in ['A', 'W', 'Y']:
-                logdbg("ignoring value for %s: '%s' (%s:%s)" %
-                       (label, value_str, fid, context))
-            elif group == 'group_time':
-                v = int(value_str)
-            else:
-                v = float(value_str)
-        except ValueError as e:
-            logerr("cannot create value for %s from '%s' (%s:%s): %s" %
-                   (label, value_str, fid, context, e))
+        is_time = group == 'group_time'
+        if type(value_str) is (int if is_time else float):
+            # values from numeric columns are already the right type, so skip
+            # the string comparisons and conversion
+            v = value_str
+        else:
+            try:
+                if value_str in [None, 'None', '']:
+                    pass
+                elif value_str in ['A', 'W', 'Y']:
+                    logdbg("ignoring value for %s: '%s' (%s:%s)" %
+                           (label, value_str, fid, context))
+                elif is_time:
+                    v = int(value_str)
+                else:
+                    v = float(value_str)
+            except ValueError as e:
+                logerr("cannot create value for %s from '%s' (%s:%s): %s" %
+                       (label, value_str, fid, context, e))
         if units is None:
             units = DEFAULT_UNITS[unit_system][group]
         vt = weewx.units.ValueTuple(v, units, group)
@@ -4467,9 +4945,10 @@ class ForecastVariables(SearchList):
         return VERSION
 
     def label(self, module, txt):
-        if module == 'NWS':  # for backward compatibility
-            module = 'Weather'
-        return self.labels.get(module, {}).get(txt, txt)
+        labels = self.labels.get(module)
+        if labels is None:
+            return txt
+        return labels.get(txt, txt)
 
     def xtide(self, index, from_ts=None):
         if from_ts is None:
@@ -4500,12 +4979,7 @@ class ForecastVariables(SearchList):
         """The zambretti forecast applies at the time at which it was created,
         and is good for about 6 hours.  So there is no difference between the
         created timestamp and event timestamp."""
-        dbm_dict = weewx.manager.get_manager_dict(
-            self.generator.config_dict['DataBindings'],
-            self.generator.config_dict['Databases'],
-            self.binding,
-            default_binding_dict=DEFAULT_BINDING_DICT)
-        with weewx.manager.open_manager(dbm_dict) as dbm:
+        with weewx.manager.open_manager(self._get_dbm_dict()) as dbm:
             sql = "select dateTime,zcode from %s where method = 'Zambretti' order by dateTime desc limit 1" % dbm.table_name
             for count in range(self.db_max_tries):
                 try:
@@ -4556,7 +5030,7 @@ class ForecastVariables(SearchList):
                                           f, r[f], UNIT_GROUPS[f],
                                           fid=fid, unit_system=r['usUnits'])
             r['precip'] = {}
-            for p in precip_types:
+            for p in PRECIP_TYPES_ORDER:
                 v = r.get(p, None)
                 if v is not None:
                     r['precip'][p] = v
@@ -4600,73 +5074,51 @@ class ForecastVariables(SearchList):
             'precip': [],
             'obvis': [],
         }
-        outlook_histogram = {}
         if periods is not None:
-            for p in periods:
-                if from_ts <= p['event_ts'].raw <= from_ts + dur:
-                    if rec['location'] is None:
-                        rec['location'] = p['location']
-                    if rec['issued_ts'] is None:
-                        rec['issued_ts'] = p['issued_ts'].raw
-                    rec['usUnits'] = p['usUnits']
-                    x = p['clouds']
-                    if x is not None:
-                        outlook_histogram[x] = outlook_histogram.get(x, 0) + 1
-                    for s in ['temp', 'dewpoint', 'humidity', 'windSpeed']:
-                        _get_stats(s, p, rec)
-                    rec['windGust'] = _get_max('windGust', p, rec)
-                    x = p['windDir']
-                    if x is not None:
-                        rec['windDirs'][x] = rec['windDirs'].get(x, 0) + 1
-                    x = p['windChar']
-                    if x is not None:
-                        rec['windChars'][x] = rec['windChars'].get(x, 0) + 1
-                    rec['pop'] = _get_max('pop', p, rec)
-                    for s in ['qpf', 'qsf']:
-                        rec[s] = _get_sum(s, p, rec)
-                    for s in ['qpfMin', 'qsfMin']:
-                        rec[s] = _get_min(s, p, rec)
-                    for s in ['qpfMax', 'qsfMax']:
-                        rec[s] = _get_max(s, p, rec)
-                    for pt in p['precip']:
-                        if pt not in rec['precip']:
-                            rec['precip'].append(pt)
-                    if p['obvis'] is not None and p['obvis'] not in rec['obvis']:
-                        rec['obvis'].append(p['obvis'])
+            rows = [p for p in periods
+                    if from_ts <= p['event_ts'].raw <= from_ts + dur]
+            issued = [p['issued_ts'].raw for p in rows]
+            for p in rows:
+                for pt in p['precip']:
+                    if pt not in rec['precip']:
+                        rec['precip'].append(pt)
         else:
-            records = self._getRecords(fid, from_ts, from_ts + dur, max_events=40)
-            for r in records:
-                if rec['location'] is None:
-                    rec['location'] = r['location']
-                if rec['issued_ts'] is None:
-                    rec['issued_ts'] = r['issued_ts']
-                rec['usUnits'] = r['usUnits']
-                x = r['clouds']
-                if x is not None:
-                    outlook_histogram[x] = outlook_histogram.get(x, 0) + 1
-                for s in ['temp', 'dewpoint', 'humidity', 'windSpeed']:
-                    _get_stats(s, r, rec)
-                rec['windGust'] = _get_max('windGust', r, rec)
-                x = r['windDir']
-                if x is not None:
-                    rec['windDirs'][x] = rec['windDirs'].get(x, 0) + 1
-                x = r['windChar']
-                if x is not None:
-                    rec['windChars'][x] = rec['windChars'].get(x, 0) + 1
-                rec['pop'] = _get_max('pop', r, rec)
+            rows = self._getRecords(fid, from_ts, from_ts + dur, max_events=40)
+            issued = [r['issued_ts'] for r in rows]
+            for r in rows:
                 r['qpf'], r['qpfMin'], r['qpfMax'] = _parse_precip_qty(r['qpf'])
                 r['qsf'], r['qsfMin'], r['qsfMax'] = _parse_precip_qty(r['qsf'])
-                for s in ['qpf', 'qsf']:
-                    rec[s] = _get_sum(s, r, rec)
-                for s in ['qpfMin', 'qsfMin']:
-                    rec[s] = _get_min(s, r, rec)
-                for s in ['qpfMax', 'qsfMax']:
-                    rec[s] = _get_max(s, r, rec)
-                for pt in precip_types:
-                    if r.get(pt, None) is not None and pt not in rec['precip']:
+                # list the types in the order they first appear, as above
+                for pt in PRECIP_TYPES_ORDER:
+                    if r.get(pt) is not None and pt not in rec['precip']:
                         rec['precip'].append(pt)
-                if r['obvis'] is not None and r['obvis'] not in rec['obvis']:
-                    rec['obvis'].append(r['obvis'])
+        rec['issued_ts'] = next((x for x in issued if x is not None), None)
+        rec['location'] = next(
+            (r['location'] for r in rows if r['location'] is not None), None)
+        if rows:
+            rec['usUnits'] = rows[-1]['usUnits']
+
+        # aggregate one field at a time over all of the rows
+        for s in ['temp', 'dewpoint', 'humidity', 'windSpeed']:
+            _get_stats(s, rows, rec)
+        for s in ['windGust', 'pop', 'qpfMax', 'qsfMax']:
+            col = _get_column(s, rows)
+            rec[s] = max(col) if col else None
+        for s in ['qpfMin', 'qsfMin']:
+            col = _get_column(s, rows)
+            rec[s] = min(col) if col else None
+        for s in ['qpf', 'qsf']:
+            col = _get_column(s, rows)
+            rec[s] = sum(col) if col else None
+        outlook_histogram = collections.Counter(
+            r['clouds'] for r in rows if r['clouds'] is not None)
+        rec['windDirs'] = collections.Counter(
+            r['windDir'] for r in rows if r['windDir'] is not None)
+        rec['windChars'] = collections.Counter(
+            r['windChar'] for r in rows if r['windChar'] is not None)
+        for r in rows:
+            if r['obvis'] is not None and r['obvis'] not in rec['obvis']:
+                rec['obvis'].append(r['obvis'])
 
         for f in SUMMARY_FIELDS_WITH_UNITS:
             rec[f] = self._create_value('weather_summary',
@@ -996,6 +996,8 @@ $forecast.zambretti.code
                 '1201 AM EDT SAT MAY 11 2013': 1368244860,
                 '1200 PM EDT SAT MAY 11 2013': 1368288000,
                 '1201 PM EDT SAT MAY 11 2013': 1368288060,
+                '100 PM EDT SAT MAY 11 2013': 1368291600,
+                '119 PM EDT SAT MAY 11 2013': 1368292740,
                 '1100 AM EDT SAT MAY 11 2013': 1368284400,
                 '418 AM EDT SAT MAY 11 2013': 1368260280,
                 '400 AM EDT SAT MAY 11 2013': 1368259200,
@@ -1097,6 +1099,12 @@ $forecast.zambretti.code
         for label in expected.keys():
             self.assertEqual(matrix[label], expected[label])
 
+    def test_nws_parse_bytes(self):
+        # on python 3 the download is bytes, not text
+        data = readfile('PFM_BIS_170205')
+        matrix = forecast.NWSParseForecast(data.encode('utf-8'), 'NDZ011')
+        self.assertEqual(matrix, forecast.NWSParseForecast(data, 'NDZ011'))
+
     def test_nws_template_periods(self):
         data = readfile('PFM_BOS_SINGLE')
         matrix = forecast.NWSParseForecast(data, 'MAZ014')
@@ -1244,6 +1252,13 @@ SW
         records,msgs = forecast.WUForecast.parse(data)
         self.assertEqual(records, [])
 
+    def test_wu_str2pc(self):
+        '''precipitation type and chance from a wx string'''
+        self.assertEqual(forecast.WUForecast.str2pc('Chance of Light Rain Showers'), ('rainshwrs', 'C'))
+        self.assertEqual(forecast.WUForecast.str2pc('Slight Chance Freezing Rain'), ('frzngrain', 'S'))
+        self.assertEqual(forecast.WUForecast.str2pc('Freezing Drizzle'), ('frzngdrzl', ''))
+        self.assertEqual(forecast.WUForecast.str2pc('Partly Cloudy'), (None, 0))
+
     def test_wu_template_periods_daily(self):
         '''verify the period behavior'''
         data = readfile('WU_TENANTS_HARBOR_DAILY')
@@ -1515,6 +1530,24 @@ S
                                  493)
 
 
+    # -------------------------------------------------------------------------
+    # Dark Sky tests
+    # -------------------------------------------------------------------------
+
+    def test_ds_partial_period(self):
+        '''a period with missing values still yields a record'''
+        text = json.dumps({'daily': {'data': [
+            {'time': 1500000000, 'temperatureLow': 50.0,
+             'temperatureHigh': 70.0, 'windSpeed': 5.0},
+            {'temperatureLow': 51.0}]}})
+        records, msgs = forecast.DSForecast.parse(text, issued_ts=1, now=2)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(records[0]['event_ts'], 1500000000)
+        self.assertEqual(records[0]['temp'], 60.0)
+        self.assertEqual(records[0]['windSpeed'], 5.0)
+        self.assertFalse('windGust' in records[0])
+
     # -------------------------------------------------------------------------
     # OWM tests
     # -------------------------------------------------------------------------
@@ -1655,6 +1688,14 @@ S
         url = forecast.AerisForecast.build_url(
             'id', 'secret', '42,-70', '1hr', forecast.AerisForecast.DEFAULT_URL)
         self.assertEqual(url, 'http://api.aerisapi.com/forecasts/closest?client_id=id&client_secret=secret&p=42,-70&filter=1hr')
+        # check a lat/lon with decimals
+        url = forecast.AerisForecast.build_url(
+            'id', 'secret', '42.36,-71.06', '1hr', forecast.AerisForecast.DEFAULT_URL)
+        self.assertEqual(url, 'http://api.aerisapi.com/forecasts/closest?client_id=id&client_secret=secret&p=42.36,-71.06&filter=1hr')
+        # check a name that only contains numbers
+        url = forecast.AerisForecast.build_url(
+            'id', 'secret', '+12-3,4', '1hr', forecast.AerisForecast.DEFAULT_URL)
+        self.assertEqual(url, 'http://api.aerisapi.com/forecasts/+12-3,4?client_id=id&client_secret=secret&filter=1hr')
 
     def test_aeris_invalid_client(self):
         ts = 1453669141
@@ -2180,6 +2221,65 @@ $ts $a.sunrise $a.sunset $gmstr
 
         self.assertNotEqual(size1, size2)
 
+    def test_save_forecast(self):
+        tdir = get_testdir('test_save_forecast')
+        rmtree(tdir)
+        config_dict = create_config(tdir, 'forecast.NWSForecast')
+        dbm = weewx.manager.open_manager_with_config(
+            config_dict, data_binding='forecast_binding',
+            initialize=True)
+        matrix = forecast.NWSParseForecast(
+            readfile('PFM_BOS_SINGLE'), 'MAZ014')
+        records = forecast.NWSProcessForecast('BOX', 'MAZ014', matrix)
+        forecast.Forecast.save_forecast(dbm, records, 'NWS')
+        saved = forecast.Forecast.get_saved_forecasts(dbm, 'NWS')
+        self.assertEqual(len(saved), len(records))
+
+    def test_save_forecast_invalid_record(self):
+        tdir = get_testdir('test_save_forecast_invalid_record')
+        rmtree(tdir)
+        config_dict = create_config(tdir, 'forecast.NWSForecast')
+        dbm = weewx.manager.open_manager_with_config(
+            config_dict, data_binding='forecast_binding',
+            initialize=True)
+        matrix = forecast.NWSParseForecast(
+            readfile('PFM_BOS_SINGLE'), 'MAZ014')
+        records = forecast.NWSProcessForecast('BOX', 'MAZ014', matrix)
+        # a record without issued_ts is rejected, but the others are saved
+        records[1]['issued_ts'] = None
+        forecast.Forecast.save_forecast(dbm, records, 'NWS', retry_wait=0)
+        saved = forecast.Forecast.get_saved_forecasts(dbm, 'NWS')
+        self.assertEqual(len(saved), len(records) - 1)
+
+    def test_download_cache(self):
+        tdir = get_testdir('test_download_cache')
+        rmtree(tdir)
+        url = 'http://example.com/forecast?key=SECRET'
+        cache = forecast.ForecastCache(tdir, 60)
+        self.assertEqual(cache.get(url), None)
+        cache.put(url, b'forecast data', now=1000)
+        self.assertEqual(cache.get(url, now=1059), b'forecast data')
+        self.assertEqual(cache.get(url, now=1060), None)
+        # a new cache, as after a restart, reads the data from disk
+        cache = forecast.ForecastCache(tdir, 60)
+        self.assertEqual(cache.get(url, now=1059), b'forecast data')
+        self.assertEqual(cache.get(url, now=1060), None)
+        # expired data are kept so that the next download can be conditional
+        lm = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        cache.put(url, b'new data', {'Last-Modified': lm}, now=2000)
+        cache = forecast.ForecastCache(tdir, 60)
+        self.assertEqual(cache.get(url, now=2060), None)
+        self.assertEqual(cache.get_validators(url), (lm, None))
+        self.assertEqual(cache.refresh(url, {}, now=2060), b'new data')
+        self.assertEqual(cache.get(url, now=2119), b'new data')
+        # a longer max-age from the server wins over the ttl
+        cache.put(url, b'new data', {'Cache-Control': 'max-age=600'}, now=3000)
+        self.assertEqual(cache.get(url, now=3599), b'new data')
+        self.assertEqual(cache.get_validators(url), None)
+        # the api key must not leak into the cache file names
+        for fn in os.listdir(tdir):
+            self.assertEqual(fn.find('SECRET'), -1)
+
 # use this to run individual tests while debugging
 def suite(testname):
     tests = [testname]